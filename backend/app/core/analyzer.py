@@ -1,6 +1,9 @@
 import ast
 import hashlib
+import io
+import random
 import re
+import tokenize
 from typing import Dict, List, Any, Optional, Tuple
 from collections import defaultdict
 import json
@@ -1271,22 +1274,49 @@ class UndeclaredVariableVisitor(ast.NodeVisitor):
         """获取未声明变量列表"""
         return self.undeclared_vars
 
+def canonical_code(code: str) -> str:
+    """规范化代码文本（去除注释、统一空白和格式），语法错误时返回原代码"""
+    try:
+        return ast.unparse(ast.parse(code))
+    except SyntaxError:
+        return code
+
+def normalize_code(code: str) -> str:
+    """统一换行符（CRLF/CR 转为 LF），解析结果和行号都不变
+
+    行尾空白不去除：字符串字面量中的空白和行尾的续行反斜杠都会影响代码语义
+    """
+    return code.replace('\r\n', '\n').replace('\r', '\n')
+
 def generate_code_hash(code: str) -> str:
     """生成代码哈希"""
-    return hashlib.md5(code.encode('utf-8')).hexdigest()
+    return hashlib.md5(code.encode('utf-8'), usedforsecurity=False).hexdigest()
+
+def generate_pattern_hash(pattern: str) -> str:
+    """生成代码模式哈希（记忆库的 pattern_hash）
+
+    与已存储的记忆库记录保持一致，沿用32位十六进制的MD5摘要；仅作为查找键使用，不涉及安全用途
+    """
+    return hashlib.md5(pattern.encode('utf-8'), usedforsecurity=False).hexdigest()
+
+def generate_code_pattern_hash(code: str) -> str:
+    """生成整段代码在记忆库中的 pattern_hash（先去除注释和格式差异，再按代码模式哈希）"""
+    return generate_pattern_hash(canonical_code(code))
+
+# 预编译提取代码模式时使用的正则表达式
+_ASSIGNMENT_PATTERN_RE = re.compile(r'(\w+)\s*=\s*([^=\n]+)')
+_FUNCTION_CALL_PATTERN_RE = re.compile(r'(\w+)\s*\([^)]*\)')
 
 def extract_code_patterns(code: str) -> List[str]:
     """提取代码模式用于记忆库匹配"""
     patterns = []
     
     # 提取变量赋值模式
-    var_assignments = re.findall(r'(\w+)\s*=\s*([^=\n]+)', code)
-    for var, value in var_assignments:
+    for var, value in _ASSIGNMENT_PATTERN_RE.findall(code):
         patterns.append(f"assignment_{var}_{value.strip()}")
     
     # 提取函数调用模式
-    func_calls = re.findall(r'(\w+)\s*\([^)]*\)', code)
-    for call in func_calls:
+    for call in _FUNCTION_CALL_PATTERN_RE.findall(code):
         patterns.append(f"function_call_{call}")
     
     # 提取控制流模式
@@ -1297,4 +1327,57 @@ def extract_code_patterns(code: str) -> List[str]:
     if 'while ' in code:
         patterns.append("control_flow_while")
     
-    return patterns 
\ No newline at end of file
+    return patterns 
+
+# MinHash 签名参数：64个哈希函数，分为16个band（每个band 4行）用于LSH候选检索
+MINHASH_NUM_PERM = 64
+MINHASH_BAND_SIZE = 4
+MINHASH_SHINGLE_SIZE = 3
+_MINHASH_PRIME = (1 << 61) - 1
+# 固定种子，保证不同进程生成的签名可以互相比较
+_minhash_rng = random.Random(20240601)
+_MINHASH_PERMUTATIONS = [
+    (_minhash_rng.randrange(1, _MINHASH_PRIME), _minhash_rng.randrange(0, _MINHASH_PRIME))
+    for _ in range(MINHASH_NUM_PERM)
+]
+_IGNORED_TOKEN_TYPES = {tokenize.COMMENT, tokenize.NL, tokenize.ENCODING, tokenize.ENDMARKER}
+
+def _code_tokens(code: str) -> List[str]:
+    """切分代码为词法单元（忽略注释和空行），无法切分时退化为正则切分"""
+    try:
+        return [
+            tok.string or tokenize.tok_name[tok.type]
+            for tok in tokenize.generate_tokens(io.StringIO(code).readline)
+            if tok.type not in _IGNORED_TOKEN_TYPES
+        ]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return re.findall(r'\w+|[^\w\s]', code)
+
+def compute_code_signature(code: str) -> List[int]:
+    """计算代码的 MinHash 签名（基于词法单元的 shingle 集合），用于近似重复代码的语义缓存"""
+    tokens = _code_tokens(code)
+    shingles = {
+        ' '.join(tokens[i:i + MINHASH_SHINGLE_SIZE])
+        for i in range(max(1, len(tokens) - MINHASH_SHINGLE_SIZE + 1))
+    }
+    hashes = [
+        int.from_bytes(hashlib.md5(shingle.encode('utf-8'), usedforsecurity=False).digest()[:8], 'little')
+        for shingle in shingles
+    ]
+    return [
+        min((a * h + b) % _MINHASH_PRIME for h in hashes)
+        for a, b in _MINHASH_PERMUTATIONS
+    ]
+
+def signature_similarity(sig_a: List[int], sig_b: List[int]) -> float:
+    """根据两个 MinHash 签名估计 Jaccard 相似度"""
+    if not sig_a or len(sig_a) != len(sig_b):
+        return 0.0
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+def signature_band_keys(signature: List[int]) -> List[str]:
+    """将签名按band切分为LSH桶键，至少共享一个桶的代码才作为相似候选"""
+    return [
+        f"{start // MINHASH_BAND_SIZE}:" + '-'.join(map(str, signature[start:start + MINHASH_BAND_SIZE]))
+        for start in range(0, len(signature), MINHASH_BAND_SIZE)
+    ]
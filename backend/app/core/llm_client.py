@@ -3,16 +3,192 @@ import json
 from typing import Dict, List, Any, Optional
 import asyncio
 import logging
+import time
+
+from .llm_parse import extract_json_from_response, clean_json_content
 
 logger = logging.getLogger(__name__)
 
+class _RateLimitFilter(logging.Filter):
+    """按消息模板限流的日志过滤器
+
+    LLM服务异常时同一类错误会被大量重复记录，每个消息模板每秒最多放行 rate 条，
+    被丢弃的记录在下一个时间窗口汇总报告一次。
+    """
+    
+    def __init__(self, rate: int = 5, per: float = 1.0):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self._windows: Dict[str, List[float]] = {}  # 模板 -> [窗口开始时间, 已放行数, 已丢弃数]
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = str(record.msg)
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.per:
+            dropped = int(window[2]) if window else 0
+            self._windows[key] = [now, 1, 0]
+            if dropped:
+                record.msg = f"{record.msg} (此前 {dropped} 条相同日志已被限流)"
+            return True
+        if window[1] < self.rate:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+logger.addFilter(_RateLimitFilter())
+
+# 默认生成参数，所有请求共用同一个字典
+_BASE_OPTIONS = {
+    "temperature": 0.1,  # 低温度以获得更一致的结果
+    "top_p": 0.9,
+    "max_tokens": 2048
+}
+
+# 类型推导提示词
+_INFER_SYSTEM_PROMPT = """你是一个Python类型推导专家。请分析给定的代码上下文，为未声明的变量推断最可能的类型。
+
+分析指导原则：
+1. 仔细分析变量的使用上下文和模式
+2. 考虑函数调用、运算符、方法调用等线索
+3. 推断具体的类型注解，使用Python 3.9+的类型注解语法
+4. 对于函数参数，分析函数内部如何使用这些参数
+5. 对于函数返回值，分析return语句
+6. 给出推理置信度(0.0-1.0)和详细解释
+
+类型注解格式要求：
+- 使用标准类型：int, float, str, bool, list, dict, set, tuple
+- 使用泛型：list[int], dict[str, int], tuple[int, str]
+- 使用联合类型：int | float, str | None
+- 使用可选类型：Optional[int] 或 int | None
+
+回复格式必须是JSON：
+{
+    "inferences": {
+        "变量名": "推断类型"
+    },
+    "explanations": {
+        "变量名": "详细推理过程"
+    },
+    "confidence": {
+        "变量名": 0.85
+    },
+    "function_suggestions": {
+        "函数名": {
+            "params": {"参数名": "类型"},
+            "return": "返回类型"
+        }
+    }
+}"""
+
+_INFER_PROMPT_TMPL = """请分析以下Python代码，推断未声明变量的类型：
+
+代码：
+```python
+{code}
+```
+
+未声明的变量：
+{var_lines}
+
+请仔细分析每个变量的使用上下文，给出类型推断、推理解释和置信度。
+特别注意：
+1. 分析函数参数在函数体内的使用方式
+2. 推断函数的返回值类型
+3. 考虑变量的赋值、运算、方法调用等使用模式
+4. 给出具体的类型注解建议"""
+
+# 类型注解建议提示词
+_ANNOTATION_PROMPT_TMPL = """分析以下Python代码，为函数参数、返回值和变量提供类型注解建议：
+
+代码：
+```python
+{code}
+```
+
+需要类型注解的函数：
+{functions}
+
+需要类型注解的变量：
+{variables}
+
+请分析代码并为每个函数和变量提供准确的类型注解建议。
+
+返回JSON格式：
+{{
+    "success": true,
+    "function_annotations": {{
+        "函数名": {{
+            "params": {{"参数名": "类型"}},
+            "return": "返回类型"
+        }}
+    }},
+    "variable_annotations": {{
+        "变量名": "类型"
+    }},
+    "confidence": 0.9
+}}
+
+类型注解要求：
+1. 使用Python 3.9+的类型提示语法
+2. 优先使用具体类型（如list[int]而不是list）
+3. 对于联合类型使用|语法（如int | float）
+4. 考虑代码的实际使用方式
+5. 如果无法确定，使用Any"""
+
+# 代码质量分析提示词
+_QUALITY_SYSTEM_PROMPT = """你是一个Python代码质量分析专家。请分析给定的代码，找出潜在的问题和改进建议。
+
+关注点：
+1. 类型安全性
+2. 代码风格
+3. 潜在的运行时错误
+4. 性能问题
+5. 最佳实践
+
+回复格式必须是JSON格式：
+{
+    "issues": [
+        {
+            "type": "问题类型",
+            "line": 行号,
+            "message": "问题描述",
+            "severity": "严重程度(low/medium/high)"
+        }
+    ],
+    "suggestions": [
+        "改进建议"
+    ],
+    "score": 评分(0-100)
+}"""
+
+_QUALITY_PROMPT_TMPL = """请分析以下Python代码的质量：
+
+```python
+{code}
+```
+
+请找出潜在问题并给出改进建议。"""
+
 class OllamaClient:
     """Ollama客户端，用于与本地qwen2.5-coder:7b模型交互"""
     
     def __init__(self, base_url: str = "http://localhost:11434", model: str = "qwen2.5-coder:7b"):
         self.base_url = base_url
         self.model = model
-        self.client = httpx.AsyncClient(timeout=60.0)
+        # 连接池在事件循环启动后按需创建，见 _ensure_client
+        self.client: Optional[httpx.AsyncClient] = None
+        self._client_lock = asyncio.Lock()
+    
+    async def _ensure_client(self) -> httpx.AsyncClient:
+        """获取共享的HTTP客户端，首次调用时在当前事件循环中创建"""
+        if self.client is None:
+            async with self._client_lock:
+                if self.client is None:
+                    self.client = httpx.AsyncClient(timeout=60.0)
+        return self.client
     
     async def generate_response(self, prompt: str, system_prompt: str = '') -> Dict[str, Any]:
         """生成响应"""
@@ -26,14 +202,11 @@ class OllamaClient:
                 "model": self.model,
                 "messages": messages,
                 "stream": False,
-                "options": {
-                    "temperature": 0.1,  # 低温度以获得更一致的结果
-                    "top_p": 0.9,
-                    "max_tokens": 2048
-                }
+                "options": _BASE_OPTIONS
             }
             
-            response = await self.client.post(
+            client = await self._ensure_client()
+            response = await client.post(
                 f"{self.base_url}/api/chat",
                 json=payload,
                 headers={"Content-Type": "application/json"}
@@ -55,7 +228,7 @@ class OllamaClient:
                 }
                 
         except Exception as e:
-            logger.error(f"LLM调用失败: {str(e)}")
+            logger.error("LLM调用失败: %s", e)
             return {
                 "success": False,
                 "content": "",
@@ -67,62 +240,11 @@ class OllamaClient:
         if not undeclared_vars:
             return {"success": True, "inferences": {}, "explanations": {}}
         
-        system_prompt = """你是一个Python类型推导专家。请分析给定的代码上下文，为未声明的变量推断最可能的类型。
-
-分析指导原则：
-1. 仔细分析变量的使用上下文和模式
-2. 考虑函数调用、运算符、方法调用等线索
-3. 推断具体的类型注解，使用Python 3.9+的类型注解语法
-4. 对于函数参数，分析函数内部如何使用这些参数
-5. 对于函数返回值，分析return语句
-6. 给出推理置信度(0.0-1.0)和详细解释
-
-类型注解格式要求：
-- 使用标准类型：int, float, str, bool, list, dict, set, tuple
-- 使用泛型：list[int], dict[str, int], tuple[int, str]
-- 使用联合类型：int | float, str | None
-- 使用可选类型：Optional[int] 或 int | None
-
-回复格式必须是JSON：
-{
-    "inferences": {
-        "变量名": "推断类型"
-    },
-    "explanations": {
-        "变量名": "详细推理过程"
-    },
-    "confidence": {
-        "变量名": 0.85
-    },
-    "function_suggestions": {
-        "函数名": {
-            "params": {"参数名": "类型"},
-            "return": "返回类型"
-        }
-    }
-}"""
-        
-        var_names = [var["name"] for var in undeclared_vars]
         var_lines = [f"- {var['name']} (第{var['lineno']}行)" for var in undeclared_vars]
         
-        prompt = f"""请分析以下Python代码，推断未声明变量的类型：
-
-代码：
-```python
-{code}
-```
-
-未声明的变量：
-{chr(10).join(var_lines)}
-
-请仔细分析每个变量的使用上下文，给出类型推断、推理解释和置信度。
-特别注意：
-1. 分析函数参数在函数体内的使用方式
-2. 推断函数的返回值类型
-3. 考虑变量的赋值、运算、方法调用等使用模式
-4. 给出具体的类型注解建议"""
+        prompt = _INFER_PROMPT_TMPL.format(code=code, var_lines="\n".join(var_lines))
         
-        response = await self.generate_response(prompt, system_prompt)
+        response = await self.generate_response(prompt, _INFER_SYSTEM_PROMPT)
         
         if response["success"]:
             try:
@@ -147,7 +269,7 @@ class OllamaClient:
                 }
                 
             except json.JSONDecodeError as e:
-                logger.error(f"JSON解析失败: {str(e)}, 原始响应: {response['content']}")
+                logger.error("JSON解析失败: %s, 原始响应: %s", e, response['content'])
                 # 尝试使用正则表达式提取变量和类型
                 fallback_result = self._fallback_parse_type_inference(response["content"])
                 if fallback_result:
@@ -178,42 +300,11 @@ class OllamaClient:
                 if not var_info.get("annotation"):  # 只处理没有类型注解的变量
                     var_list.append(var_name)
             
-            prompt = f"""分析以下Python代码，为函数参数、返回值和变量提供类型注解建议：
-
-代码：
-```python
-{code}
-```
-
-需要类型注解的函数：
-{chr(10).join(func_list) if func_list else "无"}
-
-需要类型注解的变量：
-{', '.join(var_list) if var_list else "无"}
-
-请分析代码并为每个函数和变量提供准确的类型注解建议。
-
-返回JSON格式：
-{{
-    "success": true,
-    "function_annotations": {{
-        "函数名": {{
-            "params": {{"参数名": "类型"}},
-            "return": "返回类型"
-        }}
-    }},
-    "variable_annotations": {{
-        "变量名": "类型"
-    }},
-    "confidence": 0.9
-}}
-
-类型注解要求：
-1. 使用Python 3.9+的类型提示语法
-2. 优先使用具体类型（如list[int]而不是list）
-3. 对于联合类型使用|语法（如int | float）
-4. 考虑代码的实际使用方式
-5. 如果无法确定，使用Any"""
+            prompt = _ANNOTATION_PROMPT_TMPL.format(
+                code=code,
+                functions="\n".join(func_list) if func_list else "无",
+                variables=', '.join(var_list) if var_list else "无"
+            )
 
             response = await self.generate_response(prompt)
             
@@ -245,7 +336,7 @@ class OllamaClient:
             }
             
         except Exception as e:
-            logger.error(f"LLM类型注解建议失败: {str(e)}")
+            logger.error("LLM类型注解建议失败: %s", e)
             return {
                 "success": False,
                 "error": f"类型注解建议失败: {str(e)}"
@@ -253,40 +344,9 @@ class OllamaClient:
     
     async def analyze_code_quality(self, code: str) -> Dict[str, Any]:
         """分析代码质量和潜在问题"""
-        system_prompt = """你是一个Python代码质量分析专家。请分析给定的代码，找出潜在的问题和改进建议。
-
-关注点：
-1. 类型安全性
-2. 代码风格
-3. 潜在的运行时错误
-4. 性能问题
-5. 最佳实践
-
-回复格式必须是JSON格式：
-{
-    "issues": [
-        {
-            "type": "问题类型",
-            "line": 行号,
-            "message": "问题描述",
-            "severity": "严重程度(low/medium/high)"
-        }
-    ],
-    "suggestions": [
-        "改进建议"
-    ],
-    "score": 评分(0-100)
-}"""
-        
-        prompt = f"""请分析以下Python代码的质量：
-
-```python
-{code}
-```
-
-请找出潜在问题并给出改进建议。"""
+        prompt = _QUALITY_PROMPT_TMPL.format(code=code)
         
-        response = await self.generate_response(prompt, system_prompt)
+        response = await self.generate_response(prompt, _QUALITY_SYSTEM_PROMPT)
         
         if response["success"]:
             try:
@@ -315,7 +375,7 @@ class OllamaClient:
                 }
                 
             except json.JSONDecodeError as e:
-                logger.error(f"JSON解析失败: {str(e)}, 原始响应: {response['content']}")
+                logger.error("JSON解析失败: %s, 原始响应: %s", e, response['content'])
                 return {
                     "success": False,
                     "error": f"LLM响应格式错误: {str(e)}",
@@ -327,7 +387,8 @@ class OllamaClient:
     async def check_ollama_status(self) -> Dict[str, Any]:
         """检查Ollama服务状态"""
         try:
-            response = await self.client.get(f"{self.base_url}/api/tags")
+            client = await self._ensure_client()
+            response = await client.get(f"{self.base_url}/api/tags")
             
             if response.status_code == 200:
                 models = response.json().get("models", [])
@@ -355,57 +416,17 @@ class OllamaClient:
     
     async def close(self):
         """关闭客户端连接"""
-        await self.client.aclose()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
     
     def _extract_json_from_response(self, content: str) -> str:
         """从响应中提取JSON内容"""
-        content = content.strip()
-        
-        # 方法1: 寻找json代码块
-        if "```json" in content:
-            json_start = content.find("```json") + 7
-            json_end = content.find("```", json_start)
-            if json_end > json_start:
-                return content[json_start:json_end].strip()
-        
-        # 方法2: 寻找第一个完整的JSON对象
-        brace_count = 0
-        start_index = -1
-        for i, char in enumerate(content):
-            if char == '{':
-                if start_index == -1:
-                    start_index = i
-                brace_count += 1
-            elif char == '}':
-                brace_count -= 1
-                if brace_count == 0 and start_index != -1:
-                    return content[start_index:i+1]
-        
-        # 方法3: 返回原内容
-        return content
+        return extract_json_from_response(content)
     
     def _clean_json_content(self, json_content: str) -> str:
         """清理JSON内容"""
-        import re
-        
-        # 移除多余的空白字符
-        json_content = json_content.strip()
-        
-        # 修复常见的JSON格式问题
-        # 1. 将单引号替换为双引号（如果不在字符串内）
-        json_content = re.sub(r"(?<!\\)'([^']*?)(?<!\\)'", r'"\1"', json_content)
-        
-        # 2. 在属性名周围添加双引号
-        json_content = re.sub(r'(\w+)(\s*:)', r'"\1"\2', json_content)
-        
-        # 3. 移除注释
-        json_content = re.sub(r'//.*$', '', json_content, flags=re.MULTILINE)
-        json_content = re.sub(r'/\*.*?\*/', '', json_content, flags=re.DOTALL)
-        
-        # 4. 移除多余的逗号
-        json_content = re.sub(r',(\s*[}\]])', r'\1', json_content)
-        
-        return json_content
+        return clean_json_content(json_content)
     
     def _fallback_parse_type_inference(self, content: str) -> Optional[Dict[str, Any]]:
         """备用解析方法，使用正则表达式提取类型推导信息"""
@@ -443,7 +464,7 @@ class OllamaClient:
                 }
             
         except Exception as e:
-            logger.error(f"备用解析也失败: {str(e)}")
+            logger.error("备用解析也失败: %s", e)
         
         return None
 
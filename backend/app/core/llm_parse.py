@@ -0,0 +1,68 @@
+"""LLM响应解析工具
+
+这些函数需要扫描大模型的完整输出，是解析链路上的热点。
+模块只包含带完整类型注解的纯函数，不依赖其他业务模块，
+可以直接用 mypyc 编译为C扩展（mypyc backend/app/core/llm_parse.py），
+未编译时作为普通Python模块导入，行为完全一致。
+"""
+
+import re
+
+# 预编译提取JSON时使用的正则表达式
+_JSON_BLOCK_RE = re.compile(r'```json(.*?)```', re.DOTALL)
+_BRACE_RE = re.compile(r'[{}]')
+
+# 预编译清理JSON时使用的正则表达式
+_SINGLE_QUOTE_RE = re.compile(r"(?<!\\)'([^']*?)(?<!\\)'")
+_UNQUOTED_KEY_RE = re.compile(r'(\w+)(\s*:)')
+_LINE_COMMENT_RE = re.compile(r'//.*$', re.MULTILINE)
+_BLOCK_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+
+
+def extract_json_from_response(content: str) -> str:
+    """从响应中提取JSON内容"""
+    content = content.strip()
+
+    # 方法1: 寻找json代码块
+    match = _JSON_BLOCK_RE.search(content)
+    if match and match.group(1):
+        return match.group(1).strip()
+
+    # 方法2: 寻找第一个完整的JSON对象（由正则引擎直接跳到下一个花括号）
+    brace_count: int = 0
+    start_index: int = -1
+    for brace in _BRACE_RE.finditer(content):
+        if brace.group() == '{':
+            if start_index == -1:
+                start_index = brace.start()
+            brace_count += 1
+        else:
+            brace_count -= 1
+            if brace_count == 0 and start_index != -1:
+                return content[start_index:brace.end()]
+
+    # 方法3: 返回原内容
+    return content
+
+
+def clean_json_content(json_content: str) -> str:
+    """清理JSON内容"""
+    # 移除多余的空白字符
+    json_content = json_content.strip()
+
+    # 修复常见的JSON格式问题
+    # 1. 将单引号替换为双引号（如果不在字符串内）
+    json_content = _SINGLE_QUOTE_RE.sub(r'"\1"', json_content)
+
+    # 2. 在属性名周围添加双引号
+    json_content = _UNQUOTED_KEY_RE.sub(r'"\1"\2', json_content)
+
+    # 3. 移除注释
+    json_content = _LINE_COMMENT_RE.sub('', json_content)
+    json_content = _BLOCK_COMMENT_RE.sub('', json_content)
+
+    # 4. 移除多余的逗号
+    json_content = _TRAILING_COMMA_RE.sub(r'\1', json_content)
+
+    return json_content
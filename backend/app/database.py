@@ -1,31 +1,134 @@
 import os
+import asyncio
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union, Callable, Tuple
 import json
+import logging
+import zlib
+from array import array
+
+logger = logging.getLogger(__name__)
 
 DATABASE_PATH = "database/typesage.db"
 
+# 不小于该字节数的大文本列（AST、符号表、注解代码等）使用zlib压缩后以BLOB存储
+COMPRESS_MIN_BYTES = 512
+
+# 类型推导历史接口返回的最近记录条数
+TYPE_INFERENCE_HISTORY_LIMIT = 100
+
+# 读多写少的查询结果在进程内缓存的秒数，写入对应数据表时立即失效
+READ_CACHE_TTL = 5.0
+
+# 缓存管理接口统计和清理的数据表
+CACHE_TABLES = ('analysis_records', 'type_inference_history', 'memory_store', 'type_annotation_cache')
+
+# 批量查询时每条 IN 语句包含的最大参数个数（低于SQLite默认上限999）
+BULK_QUERY_BATCH_SIZE = 500
+
+INDEXES = [
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_ar_hash ON analysis_records(code_hash)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_ms_hash ON memory_store(pattern_hash)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_tac_hash_llm ON type_annotation_cache(code_hash, use_llm)',
+    'CREATE INDEX IF NOT EXISTS idx_ar_created ON analysis_records(created_at DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_tac_created ON type_annotation_cache(created_at DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_ms_usage ON memory_store(usage_count DESC, last_used DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_ms_confidence ON memory_store(confidence_score)',
+    'CREATE INDEX IF NOT EXISTS idx_tih_created ON type_inference_history(created_at DESC, validation_result)',
+    'CREATE INDEX IF NOT EXISTS idx_asb_band ON analysis_signature_bands(band_key)',
+    'CREATE INDEX IF NOT EXISTS idx_asb_hash ON analysis_signature_bands(code_hash)',
+]
+
+# 记忆库模式全文索引（trigram 分词，支持任意子串匹配），由触发器与 memory_store 保持同步
+MEMORY_FTS_TABLE_SQL = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS memory_store_fts USING fts5(
+        code_pattern, content='memory_store', content_rowid='id', tokenize='trigram'
+    )
+'''
+
+MEMORY_FTS_TRIGGERS = [
+    '''CREATE TRIGGER IF NOT EXISTS memory_store_fts_ai AFTER INSERT ON memory_store BEGIN
+        INSERT INTO memory_store_fts(rowid, code_pattern) VALUES (new.id, new.code_pattern);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS memory_store_fts_ad AFTER DELETE ON memory_store BEGIN
+        INSERT INTO memory_store_fts(memory_store_fts, rowid, code_pattern) VALUES ('delete', old.id, old.code_pattern);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS memory_store_fts_au AFTER UPDATE OF code_pattern ON memory_store BEGIN
+        INSERT INTO memory_store_fts(memory_store_fts, rowid, code_pattern) VALUES ('delete', old.id, old.code_pattern);
+        INSERT INTO memory_store_fts(rowid, code_pattern) VALUES (new.id, new.code_pattern);
+    END''',
+]
+
+# trigram 全文索引能匹配的最短查询长度，更短的查询退化为 LIKE 扫描
+FTS_MIN_QUERY_LENGTH = 3
+
 class Database:
     def __init__(self):
         self.db_path = DATABASE_PATH
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        # 每个线程复用自己的长连接（WAL模式下不同线程的读可以并发进行）
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        # 当前SQLite是否支持 FTS5 trigram 分词（建表时检测）
+        self.fts_available = False
     
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+    def get_connection(self) -> sqlite3.Connection:
+        """获取当前线程的长连接，首次调用时创建并设置PRAGMA"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # 关闭时由主线程统一关闭所有线程的连接，因此关闭同线程检查
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA mmap_size=268435456')
+            # INSERT OR REPLACE 删除旧行时也要触发删除触发器，保证全文索引同步
+            conn.execute('PRAGMA recursive_triggers=ON')
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
         return conn
     
+    @contextmanager
+    def connection(self):
+        """使用当前线程的连接执行一个事务：正常结束时提交，出现异常时回滚"""
+        conn = self.get_connection()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    
+    def close(self):
+        """关闭所有线程的连接（应用退出时调用）"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+    
     def init_tables(self):
         """初始化数据库表"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            # 多个工作进程同时启动时，建表过程通过写事务串行执行
+            cursor.execute('BEGIN IMMEDIATE')
+            self._create_tables(cursor)
+    
+    def _create_tables(self, cursor: sqlite3.Cursor):
+        """创建数据库表和索引"""
         # 创建分析记录表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS analysis_records (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code_hash TEXT UNIQUE NOT NULL,
+                id INTEGER PRIMARY KEY,
+                code_hash TEXT NOT NULL,
                 original_code TEXT NOT NULL,
                 ast_data TEXT,
                 symbol_table TEXT,
@@ -39,8 +142,8 @@ class Database:
         # 创建记忆库表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS memory_store (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                pattern_hash TEXT UNIQUE NOT NULL,
+                id INTEGER PRIMARY KEY,
+                pattern_hash TEXT NOT NULL,
                 code_pattern TEXT NOT NULL,
                 inferred_types TEXT,
                 confidence_score REAL,
@@ -53,7 +156,7 @@ class Database:
         # 创建类型推导历史表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS type_inference_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                id INTEGER PRIMARY KEY,
                 variable_name TEXT NOT NULL,
                 context_code TEXT,
                 traditional_type TEXT,
@@ -68,8 +171,8 @@ class Database:
         # 创建类型注解缓存表
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS type_annotation_cache (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code_hash TEXT UNIQUE NOT NULL,
+                id INTEGER PRIMARY KEY,
+                code_hash TEXT NOT NULL,
                 original_code TEXT NOT NULL,
                 annotated_code TEXT NOT NULL,
                 type_info TEXT,
@@ -81,12 +184,110 @@ class Database:
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        # 创建AST可视化缓存表（zlib压缩的JSON）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ast_visualization_cache (
+                code_hash TEXT PRIMARY KEY,
+                payload BLOB NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # 创建分析记录的 MinHash 签名表及其LSH分桶表（用于查找近似重复代码）
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_signatures (
+                code_hash TEXT PRIMARY KEY,
+                signature BLOB NOT NULL
+            )
+        ''')
+        
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS analysis_signature_bands (
+                band_key TEXT NOT NULL,
+                code_hash TEXT NOT NULL
+            )
+        ''')
+        
+        # 创建索引：按哈希查找的列使用唯一索引，注解缓存按 (code_hash, use_llm) 联合查找，
+        # 最近记录按 created_at 倒序查找，记忆库按使用次数排序、按置信度过滤
+        for index_sql in INDEXES:
+            cursor.execute(index_sql)
+        
+        self._create_memory_fts(cursor)
+        
+        # 按需更新查询规划器的统计信息（仅在新建索引或数据量明显变化时才会执行ANALYZE）
+        cursor.execute('PRAGMA optimize')
+
+    def _create_memory_fts(self, cursor: sqlite3.Cursor):
+        """创建记忆库全文索引及同步触发器，SQLite不支持 FTS5 trigram 时跳过"""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'memory_store_fts'")
+        exists = cursor.fetchone() is not None
+        try:
+            if not exists:
+                cursor.execute(MEMORY_FTS_TABLE_SQL)
+                # 为已有的记忆库数据建立索引
+                cursor.execute("INSERT INTO memory_store_fts(memory_store_fts) VALUES ('rebuild')")
+            for trigger_sql in MEMORY_FTS_TRIGGERS:
+                cursor.execute(trigger_sql)
+            self.fts_available = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite不支持FTS5 trigram，记忆库搜索将使用LIKE: {str(e)}")
 
 # 数据库实例
 db = Database()
 
+# 进程内读缓存：{(所依赖的数据表元组, 查询名, 查询参数...): (过期时间, 结果)}
+_read_cache: Dict[tuple, Tuple[float, Any]] = {}
+_read_cache_generation = 0
+_read_cache_lock = threading.Lock()
+
+def _cached_read(key: tuple, loader: Callable[[], Any]) -> Any:
+    """在 READ_CACHE_TTL 内复用 loader 的结果，key 的第一个元素为结果所依赖的数据表元组"""
+    with _read_cache_lock:
+        entry = _read_cache.get(key)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        generation = _read_cache_generation
+    
+    value = loader()
+    
+    with _read_cache_lock:
+        # 读取期间有写入发生时不缓存，避免把过期结果保存下来
+        if generation == _read_cache_generation:
+            now = time.monotonic()
+            # 分页参数会产生不同的 key，写入前顺便清理已过期的条目，避免缓存无限增长
+            for expired in [k for k, (expires, _) in _read_cache.items() if expires <= now]:
+                del _read_cache[expired]
+            _read_cache[key] = (now + READ_CACHE_TTL, value)
+    return value
+
+def invalidate_read_cache(*tables: str):
+    """写入数据表的事务提交后调用，使依赖这些表的读缓存失效"""
+    global _read_cache_generation
+    with _read_cache_lock:
+        _read_cache_generation += 1
+        for key in [key for key in _read_cache if not set(key[0]).isdisjoint(tables)]:
+            del _read_cache[key]
+
+def _pack_text(text: str) -> Union[str, bytes]:
+    """较大的文本压缩为BLOB，较小的保持原文存储"""
+    data = text.encode('utf-8')
+    return zlib.compress(data) if len(data) >= COMPRESS_MIN_BYTES else text
+
+def _unpack_text(value: Union[str, bytes, None]) -> Optional[str]:
+    """还原 _pack_text 存储的值，兼容未压缩的旧记录"""
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+def _pack_json(obj: Any) -> Union[str, bytes]:
+    """序列化为JSON并按大小决定是否压缩"""
+    return _pack_text(json.dumps(obj, ensure_ascii=False))
+
+def _unpack_json(value: Union[str, bytes, None]) -> Any:
+    """还原 _pack_json 存储的JSON，空值返回空字典"""
+    return json.loads(_unpack_text(value)) if value else {}
+
 def init_database():
     """初始化数据库"""
     db.init_tables()
@@ -98,10 +299,9 @@ async def init_db():
 def save_analysis_record(code_hash: str, original_code: str, ast_data: Dict, 
                         symbol_table: Dict, type_inference: Dict, llm_suggestions: Dict) -> int | None:
     """保存分析记录到数据库"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
         cursor.execute('''
             INSERT OR REPLACE INTO analysis_records 
             (code_hash, original_code, ast_data, symbol_table, type_inference, llm_suggestions, updated_at)
@@ -109,50 +309,137 @@ def save_analysis_record(code_hash: str, original_code: str, ast_data: Dict,
         ''', (
             code_hash,
             original_code,
-            json.dumps(ast_data, ensure_ascii=False),
-            json.dumps(symbol_table, ensure_ascii=False),
-            json.dumps(type_inference, ensure_ascii=False),
-            json.dumps(llm_suggestions, ensure_ascii=False),
+            _pack_json(ast_data),
+            _pack_json(symbol_table),
+            _pack_json(type_inference),
+            _pack_json(llm_suggestions),
             datetime.now().isoformat()
         ))
         
         record_id = cursor.lastrowid
-        conn.commit()
+        
+        # 分析结果已更新，旧的可视化缓存失效
+        cursor.execute('DELETE FROM ast_visualization_cache WHERE code_hash = ?', (code_hash,))
         return record_id
-    finally:
-        conn.close()
+
+async def save_analysis_record_async(code_hash: str, original_code: str, ast_data: Dict,
+                                     symbol_table: Dict, type_inference: Dict, llm_suggestions: Dict) -> int | None:
+    """异步保存分析记录，JSON序列化和写库都在线程池中执行，避免阻塞事件循环"""
+    return await asyncio.to_thread(
+        save_analysis_record, code_hash, original_code, ast_data,
+        symbol_table, type_inference, llm_suggestions
+    )
 
 def get_analysis_record(code_hash: str) -> Optional[Dict]:
     """根据代码哈希获取分析记录"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
         cursor.execute('SELECT * FROM analysis_records WHERE code_hash = ?', (code_hash,))
         row = cursor.fetchone()
         
         if row:
-            return {
-                'id': row['id'],
-                'code_hash': row['code_hash'],
-                'original_code': row['original_code'],
-                'ast_data': json.loads(row['ast_data']) if row['ast_data'] else {},
-                'symbol_table': json.loads(row['symbol_table']) if row['symbol_table'] else {},
-                'type_inference': json.loads(row['type_inference']) if row['type_inference'] else {},
-                'llm_suggestions': json.loads(row['llm_suggestions']) if row['llm_suggestions'] else {},
-                'created_at': row['created_at'],
-                'updated_at': row['updated_at']
-            }
+            return _row_to_analysis_record(row)
         return None
-    finally:
-        conn.close()
+
+def get_analysis_records_bulk(code_hashes: List[str]) -> Dict[str, Dict]:
+    """批量获取分析记录，返回 {code_hash: 记录}，不存在的哈希不会出现在结果中"""
+    unique_hashes = list(dict.fromkeys(code_hashes))
+    if not unique_hashes:
+        return {}
+    
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        records = {}
+        # 分批使用 IN 查询，避免超过SQLite的参数数量上限
+        for start in range(0, len(unique_hashes), BULK_QUERY_BATCH_SIZE):
+            batch = unique_hashes[start:start + BULK_QUERY_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            cursor.execute(
+                f'SELECT * FROM analysis_records WHERE code_hash IN ({placeholders})', batch
+            )
+            for row in cursor.fetchall():
+                records[row['code_hash']] = _row_to_analysis_record(row)
+        return records
+
+def _row_to_analysis_record(row: sqlite3.Row) -> Dict:
+    """将 analysis_records 行转换为字典"""
+    return {
+        'id': row['id'],
+        'code_hash': row['code_hash'],
+        'original_code': row['original_code'],
+        'ast_data': _unpack_json(row['ast_data']),
+        'symbol_table': _unpack_json(row['symbol_table']),
+        'type_inference': _unpack_json(row['type_inference']),
+        'llm_suggestions': _unpack_json(row['llm_suggestions']),
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at']
+    }
+
+def save_analysis_signature(code_hash: str, signature: List[int], band_keys: List[str]):
+    """保存分析记录的 MinHash 签名及其LSH桶键"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT OR REPLACE INTO analysis_signatures (code_hash, signature)
+            VALUES (?, ?)
+        ''', (code_hash, array('Q', signature).tobytes()))
+        
+        cursor.execute('DELETE FROM analysis_signature_bands WHERE code_hash = ?', (code_hash,))
+        cursor.executemany('''
+            INSERT INTO analysis_signature_bands (band_key, code_hash)
+            VALUES (?, ?)
+        ''', [(band_key, code_hash) for band_key in band_keys])
+
+def get_signature_candidates(band_keys: List[str]) -> Dict[str, List[int]]:
+    """获取与给定桶键至少共享一个桶、且仍有分析记录的候选签名，返回 {code_hash: 签名}"""
+    if not band_keys:
+        return {}
+    
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        placeholders = ', '.join('?' * len(band_keys))
+        cursor.execute(f'''
+            SELECT s.code_hash, s.signature
+            FROM analysis_signatures s
+            JOIN analysis_records r ON r.code_hash = s.code_hash
+            WHERE s.code_hash IN (
+                SELECT code_hash FROM analysis_signature_bands WHERE band_key IN ({placeholders})
+            )
+        ''', band_keys)
+        
+        return {
+            row['code_hash']: array('Q', row['signature']).tolist()
+            for row in cursor.fetchall()
+        }
+
+def save_ast_visualization(code_hash: str, payload: bytes):
+    """保存AST可视化结果（UTF-8编码的JSON，压缩后存储）"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            INSERT OR REPLACE INTO ast_visualization_cache (code_hash, payload)
+            VALUES (?, ?)
+        ''', (code_hash, zlib.compress(payload)))
+
+def get_ast_visualization_cache(code_hash: str) -> Optional[bytes]:
+    """获取缓存的AST可视化结果（UTF-8编码的JSON）"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT payload FROM ast_visualization_cache WHERE code_hash = ?', (code_hash,))
+        row = cursor.fetchone()
+        return zlib.decompress(row['payload']) if row else None
 
 def save_memory_pattern(pattern_hash: str, code_pattern: str, inferred_types: Dict, confidence_score: float):
     """保存模式到记忆库"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
         cursor.execute('''
             INSERT OR REPLACE INTO memory_store 
             (pattern_hash, code_pattern, inferred_types, confidence_score, last_used)
@@ -171,44 +458,130 @@ def save_memory_pattern(pattern_hash: str, code_pattern: str, inferred_types: Di
             SET usage_count = usage_count + 1 
             WHERE pattern_hash = ?
         ''', (pattern_hash,))
-        
-        conn.commit()
-    finally:
-        conn.close()
+    
+    invalidate_read_cache('memory_store')
+
+def save_memory_patterns_many(rows: List[tuple]):
+    """批量保存模式到记忆库
 
-def get_memory_patterns() -> List[Dict]:
-    """获取所有记忆库模式"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
+    rows 中每一项为 (pattern_hash, code_pattern, inferred_types, confidence_score)，
+    在同一事务中写入，语义与逐条调用 save_memory_pattern 相同
+    """
+    if not rows:
+        return
     
-    try:
-        cursor.execute('SELECT * FROM memory_store ORDER BY usage_count DESC, last_used DESC')
-        rows = cursor.fetchall()
-        
-        return [
-            {
-                'id': row['id'],
-                'pattern_hash': row['pattern_hash'],
-                'code_pattern': row['code_pattern'],
-                'inferred_types': json.loads(row['inferred_types']) if row['inferred_types'] else {},
-                'confidence_score': row['confidence_score'],
-                'usage_count': row['usage_count'],
-                'created_at': row['created_at'],
-                'last_used': row['last_used']
-            }
-            for row in rows
-        ]
-    finally:
-        conn.close()
+    # 同一批次中重复的模式只保留最后一条，与逐条覆盖写入的结果一致
+    latest = {row[0]: row for row in rows}
+    now = datetime.now().isoformat()
+    
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
+            INSERT OR REPLACE INTO memory_store 
+            (pattern_hash, code_pattern, inferred_types, confidence_score, last_used)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            (pattern_hash, code_pattern, json.dumps(inferred_types, ensure_ascii=False), confidence_score, now)
+            for pattern_hash, code_pattern, inferred_types, confidence_score in latest.values()
+        ])
+        
+        # 更新使用次数
+        cursor.executemany('''
+            UPDATE memory_store 
+            SET usage_count = usage_count + 1 
+            WHERE pattern_hash = ?
+        ''', [(pattern_hash,) for pattern_hash in latest])
+    
+    invalidate_read_cache('memory_store')
+
+def get_memory_patterns(limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """获取记忆库模式，limit 为 None 时返回 offset 之后的全部模式"""
+    with db.connection() as conn:
+        return _select_memory_patterns(conn.cursor(), limit, offset)
+
+def _select_memory_patterns(cursor: sqlite3.Cursor, limit: Optional[int], offset: int) -> List[Dict]:
+    """在给定游标上查询记忆库模式"""
+    cursor.execute(
+        'SELECT * FROM memory_store ORDER BY usage_count DESC, last_used DESC LIMIT ? OFFSET ?',
+        (-1 if limit is None else limit, offset)
+    )
+    return [_row_to_memory_pattern(row) for row in cursor.fetchall()]
+
+def get_memory_patterns_cached(limit: Optional[int] = None, offset: int = 0) -> List[Dict]:
+    """获取记忆库模式（短时缓存，返回的列表在调用方之间共享，不得修改）"""
+    return _cached_read(
+        (('memory_store',), 'patterns', limit, offset),
+        lambda: get_memory_patterns(limit, offset)
+    )
+
+def search_memory_patterns_db(query: str = "", confidence_min: float = 0.0,
+                              limit: Optional[int] = None, offset: int = 0) -> Tuple[List[Dict], int]:
+    """按置信度和代码模式子串（不区分大小写）搜索记忆库，排序与 get_memory_patterns 相同
+
+    Returns:
+        (当前分页的模式列表, 匹配的模式总数)，两者在同一读事务中查询
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        
+        where = 'confidence_score >= ?'
+        params: List[Any] = [confidence_min]
+        
+        if query and db.fts_available and len(query) >= FTS_MIN_QUERY_LENGTH:
+            # 短语查询：trigram 分词下等价于子串匹配
+            where += ' AND id IN (SELECT rowid FROM memory_store_fts WHERE memory_store_fts MATCH ?)'
+            params.append('"' + query.replace('"', '""') + '"')
+        elif query:
+            # 短查询无法使用 trigram 索引；SQLite 的 LIKE 只对 ASCII 忽略大小写，因此在Python中按 casefold 匹配
+            cursor.execute(
+                f'SELECT * FROM memory_store WHERE {where} ORDER BY usage_count DESC, last_used DESC', params
+            )
+            needle = query.casefold()
+            rows = [row for row in cursor.fetchall() if needle in row['code_pattern'].casefold()]
+            end = None if limit is None else offset + limit
+            return [_row_to_memory_pattern(row) for row in rows[offset:end]], len(rows)
+        
+        cursor.execute(
+            f'SELECT * FROM memory_store WHERE {where} '
+            'ORDER BY usage_count DESC, last_used DESC LIMIT ? OFFSET ?',
+            params + [-1 if limit is None else limit, offset]
+        )
+        patterns = [_row_to_memory_pattern(row) for row in cursor.fetchall()]
+        
+        cursor.execute(f'SELECT COUNT(*) FROM memory_store WHERE {where}', params)
+        return patterns, cursor.fetchone()[0]
+
+def get_memory_pattern_by_hash(pattern_hash: str) -> Optional[Dict]:
+    """根据模式哈希获取记忆库模式"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('SELECT * FROM memory_store WHERE pattern_hash = ?', (pattern_hash,))
+        row = cursor.fetchone()
+        return _row_to_memory_pattern(row) if row else None
+
+def _row_to_memory_pattern(row: sqlite3.Row) -> Dict:
+    """将 memory_store 行转换为字典"""
+    return {
+        'id': row['id'],
+        'pattern_hash': row['pattern_hash'],
+        'code_pattern': row['code_pattern'],
+        'inferred_types': json.loads(row['inferred_types']) if row['inferred_types'] else {},
+        'confidence_score': row['confidence_score'],
+        'usage_count': row['usage_count'],
+        'created_at': row['created_at'],
+        'last_used': row['last_used']
+    }
 
 def save_type_inference_history(variable_name: str, context_code: str, traditional_type: str,
                                llm_inferred_type: str, final_type: str, confidence: float,
                                validation_result: str):
     """保存类型推导历史"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
         cursor.execute('''
             INSERT INTO type_inference_history 
             (variable_name, context_code, traditional_type, llm_inferred_type, 
@@ -218,57 +591,159 @@ def save_type_inference_history(variable_name: str, context_code: str, tradition
             variable_name, context_code, traditional_type, llm_inferred_type,
             final_type, confidence, validation_result
         ))
-        
-        conn.commit()
-    finally:
-        conn.close()
+    
+    invalidate_read_cache('type_inference_history')
+
+def save_type_inference_history_many(rows: List[tuple]):
+    """批量保存类型推导历史
 
-def get_type_inference_history() -> List[Dict]:
-    """获取类型推导历史"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
+    rows 中每一项为 (variable_name, context_code, traditional_type, llm_inferred_type,
+    final_type, confidence, validation_result)，在同一事务中通过 executemany 写入
+    """
+    if not rows:
+        return
     
-    try:
-        cursor.execute('SELECT * FROM type_inference_history ORDER BY created_at DESC LIMIT 100')
-        rows = cursor.fetchall()
+    with db.connection() as conn:
+        cursor = conn.cursor()
         
-        return [dict(row) for row in rows]
-    finally:
-        conn.close()
+        cursor.executemany('''
+            INSERT INTO type_inference_history 
+            (variable_name, context_code, traditional_type, llm_inferred_type, 
+             final_type, confidence, validation_result)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    
+    invalidate_read_cache('type_inference_history')
+
+def get_type_inference_history(limit: int = TYPE_INFERENCE_HISTORY_LIMIT, offset: int = 0) -> List[Dict]:
+    """获取类型推导历史，按时间倒序"""
+    with db.connection() as conn:
+        return _select_type_inference_history(conn.cursor(), limit, offset)
+
+def _select_type_inference_history(cursor: sqlite3.Cursor, limit: int, offset: int) -> List[Dict]:
+    """在给定游标上查询类型推导历史"""
+    cursor.execute(
+        'SELECT * FROM type_inference_history ORDER BY created_at DESC LIMIT ? OFFSET ?',
+        (limit, offset)
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+def get_type_inference_history_cached(limit: int = TYPE_INFERENCE_HISTORY_LIMIT, offset: int = 0) -> List[Dict]:
+    """获取类型推导历史（短时缓存，返回的列表在调用方之间共享，不得修改）"""
+    return _cached_read(
+        (('type_inference_history',), 'recent', limit, offset),
+        lambda: get_type_inference_history(limit, offset)
+    )
+
+def get_export_bundle() -> Tuple[List[Dict], List[Dict]]:
+    """在同一连接的同一读事务中获取全部记忆库模式和最近的类型推导历史，两者来自同一数据快照"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN')
+        
+        patterns = _select_memory_patterns(cursor, None, 0)
+        history = _select_type_inference_history(cursor, TYPE_INFERENCE_HISTORY_LIMIT, 0)
+        return patterns, history
+
+def get_memory_statistics_agg() -> Dict[str, Any]:
+    """在SQLite中聚合记忆库统计信息
+
+    推导次数和成功率按最近 TYPE_INFERENCE_HISTORY_LIMIT 条历史计算，与历史接口返回的范围一致
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        total_patterns, high, medium, low = cursor.execute('''
+            SELECT
+                COUNT(*),
+                COUNT(CASE WHEN confidence_score >= 0.8 THEN 1 END),
+                COUNT(CASE WHEN confidence_score >= 0.5 AND confidence_score < 0.8 THEN 1 END),
+                COUNT(CASE WHEN confidence_score < 0.5 THEN 1 END)
+            FROM memory_store
+        ''').fetchone()
+        
+        total_inferences, successful_inferences = cursor.execute('''
+            SELECT COUNT(*), COUNT(CASE WHEN validation_result = 'llm_inferred' THEN 1 END)
+            FROM (
+                SELECT validation_result FROM type_inference_history
+                ORDER BY created_at DESC
+                LIMIT ?
+            )
+        ''', (TYPE_INFERENCE_HISTORY_LIMIT,)).fetchone()
+        
+        cursor.execute('''
+            SELECT code_pattern, usage_count, confidence_score
+            FROM memory_store
+            ORDER BY usage_count DESC, last_used DESC
+            LIMIT 5
+        ''')
+        most_used_patterns = [
+            {"pattern": row[0], "usage_count": row[1], "confidence": row[2]}
+            for row in cursor.fetchall()
+        ]
+        
+        return {
+            "total_patterns": total_patterns,
+            "total_inferences": total_inferences,
+            "success_rate": successful_inferences / total_inferences if total_inferences > 0 else 0,
+            "confidence_distribution": {"high": high, "medium": medium, "low": low},
+            "most_used_patterns": most_used_patterns
+        }
+
+def get_memory_statistics_cached() -> Dict[str, Any]:
+    """获取记忆库统计信息（短时缓存，返回的字典在调用方之间共享，不得修改）"""
+    return _cached_read(
+        (('memory_store', 'type_inference_history'), 'statistics'), get_memory_statistics_agg
+    )
 
 def save_type_annotation_cache(code_hash: str, original_code: str, annotated_code: str, 
                                type_info: dict, annotations_count: int, 
                                llm_suggestions_used: bool, use_llm: bool):
     """保存类型注解缓存"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
+    save_type_annotation_caches([{
+        "code_hash": code_hash,
+        "original_code": original_code,
+        "annotated_code": annotated_code,
+        "type_info": type_info,
+        "annotations_count": annotations_count,
+        "llm_suggestions_used": llm_suggestions_used,
+        "use_llm": use_llm
+    }])
+
+def save_type_annotation_caches(rows: List[Dict[str, Any]]):
+    """批量保存类型注解缓存
+
+    rows 中每一项的键与 save_type_annotation_cache 的参数相同，在同一事务中通过 executemany 写入
+    """
+    if not rows:
+        return
     
-    try:
-        cursor.execute('''
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.executemany('''
             INSERT OR REPLACE INTO type_annotation_cache 
             (code_hash, original_code, annotated_code, type_info, annotations_count, 
              llm_suggestions_used, use_llm, updated_at)
             VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        ''', (
-            code_hash,
-            original_code,
-            annotated_code,
-            json.dumps(type_info),
-            annotations_count,
-            llm_suggestions_used,
-            use_llm
-        ))
-        
-        conn.commit()
-    finally:
-        conn.close()
+        ''', [
+            (
+                row["code_hash"],
+                row["original_code"],
+                _pack_text(row["annotated_code"]),
+                _pack_text(json.dumps(row["type_info"])),
+                row["annotations_count"],
+                row["llm_suggestions_used"],
+                row["use_llm"]
+            )
+            for row in rows
+        ])
 
 def get_type_annotation_cache(code_hash: str, use_llm: bool) -> Optional[Dict[str, Any]]:
     """获取类型注解缓存"""
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    try:
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
         cursor.execute('''
             SELECT original_code, annotated_code, type_info, annotations_count, 
                    llm_suggestions_used, created_at
@@ -280,12 +755,108 @@ def get_type_annotation_cache(code_hash: str, use_llm: bool) -> Optional[Dict[st
         if row:
             return {
                 "original_code": row[0],
-                "annotated_code": row[1],
-                "type_info": json.loads(row[2]),
+                "annotated_code": _unpack_text(row[1]),
+                "type_info": json.loads(_unpack_text(row[2])),
                 "annotations_count": row[3],
                 "llm_suggestions_used": bool(row[4]),
                 "created_at": row[5]
             }
         return None
-    finally:
-        conn.close() 
\ No newline at end of file
+
+def clear_all_caches() -> Dict[str, int]:
+    """清除所有分析缓存、记忆库和推导历史，返回各表删除的记录数"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cleared = {}
+        for table in CACHE_TABLES:
+            cursor.execute(f'DELETE FROM {table}')
+            cleared[table] = cursor.rowcount
+        
+        # AST可视化缓存和签名是派生数据，不计入统计
+        for table in ('ast_visualization_cache', 'analysis_signatures', 'analysis_signature_bands'):
+            cursor.execute(f'DELETE FROM {table}')
+    
+    invalidate_read_cache(*CACHE_TABLES)
+    return cleared
+
+def get_cached_original_code(code_hash: str) -> Optional[str]:
+    """获取分析记录或类型注解缓存中保存的原始代码"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        row = cursor.execute('''
+            SELECT original_code FROM analysis_records WHERE code_hash = ?
+            UNION ALL
+            SELECT original_code FROM type_annotation_cache WHERE code_hash = ?
+            LIMIT 1
+        ''', (code_hash, code_hash)).fetchone()
+        return row[0] if row else None
+
+def clear_code_caches(code_hash: str, pattern_hash: Optional[str] = None) -> Dict[str, int]:
+    """清除特定代码的分析记录和类型注解缓存，返回各表删除的记录数
+
+    pattern_hash 为该代码整体在记忆库中的键，给出时一并删除记忆库中该代码的类型推断结果
+    """
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        cleared = {}
+        for table in ('analysis_records', 'type_annotation_cache'):
+            cursor.execute(f'DELETE FROM {table} WHERE code_hash = ?', (code_hash,))
+            cleared[table] = cursor.rowcount
+        
+        cleared['memory_store'] = 0
+        if pattern_hash:
+            cursor.execute('DELETE FROM memory_store WHERE pattern_hash = ?', (pattern_hash,))
+            cleared['memory_store'] = cursor.rowcount
+        
+        for table in ('ast_visualization_cache', 'analysis_signatures', 'analysis_signature_bands'):
+            cursor.execute(f'DELETE FROM {table} WHERE code_hash = ?', (code_hash,))
+    
+    if cleared['memory_store']:
+        invalidate_read_cache('memory_store')
+    return cleared
+
+def _count_cache_tables(cursor: sqlite3.Cursor) -> Dict[str, int]:
+    """用一条语句统计各缓存表的记录数"""
+    row = cursor.execute(
+        'SELECT ' + ', '.join(f'(SELECT COUNT(*) FROM {table})' for table in CACHE_TABLES)
+    ).fetchone()
+    return dict(zip(CACHE_TABLES, row))
+
+def get_cache_statistics() -> Dict[str, Any]:
+    """获取各缓存表的记录数和最近的缓存记录"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        
+        counts = _count_cache_tables(cursor)
+        
+        # 最近5条分析记录和最近3条类型注解记录合并后取最近5条
+        cursor.execute('''
+            SELECT code_hash, created_at, type FROM (
+                SELECT * FROM (
+                    SELECT code_hash, created_at, 'analysis' AS type
+                    FROM analysis_records
+                    ORDER BY created_at DESC
+                    LIMIT 5
+                )
+                UNION ALL
+                SELECT * FROM (
+                    SELECT code_hash, created_at, 'annotation' AS type
+                    FROM type_annotation_cache
+                    ORDER BY created_at DESC
+                    LIMIT 3
+                )
+            )
+            ORDER BY created_at DESC
+            LIMIT 5
+        ''')
+        
+        return {
+            "counts": counts,
+            "recent_records": [
+                {"code_hash": row[0], "created_at": row[1], "type": row[2]}
+                for row in cursor.fetchall()
+            ]
+        }
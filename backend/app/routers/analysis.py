@@ -1,16 +1,27 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from pydantic import BaseModel
-from typing import Dict, List, Any, Optional
-import hashlib
+from typing import Dict, List, Any, Optional, Set, Tuple
+import asyncio
+import json
 import logging
+import statistics
+from functools import lru_cache, partial
 
-from ..core.analyzer import ASTAnalyzer, TypeInferrer, generate_code_hash, extract_code_patterns
+import orjson
+
+from ..core.analyzer import (
+    ASTAnalyzer, TypeInferrer, generate_code_hash, generate_pattern_hash, generate_code_pattern_hash,
+    normalize_code, extract_code_patterns, compute_code_signature, signature_similarity, signature_band_keys
+)
 from ..core.llm_client import llm_client
 from ..database import (
-    save_analysis_record, get_analysis_record, 
-    save_memory_pattern, save_type_inference_history,
+    save_analysis_record_async, get_analysis_record, 
+    save_analysis_signature, get_signature_candidates,
+    save_memory_pattern, save_memory_patterns_many, get_memory_pattern_by_hash,
+    save_type_inference_history_many,
     save_type_annotation_cache, get_type_annotation_cache,
-    db
+    save_ast_visualization, get_ast_visualization_cache,
+    clear_all_caches, clear_code_caches, get_cached_original_code, get_cache_statistics
 )
 
 logger = logging.getLogger(__name__)
@@ -33,125 +44,288 @@ class CodeAnalysisResponse(BaseModel):
     type_annotations: Optional[Dict[str, Any]] = None
     code_quality: Optional[Dict[str, Any]] = None
     cached: bool = False
+    semantic: bool = False  # 类型推断结果是否复用自近似重复代码的缓存
     error: Optional[str] = None
 
+def _json_default(value: Any) -> Any:
+    """orjson 无法直接序列化的值（如AST常量中的bytes）转换为字符串"""
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    return str(value)
+
+def _json_response(model: BaseModel) -> Response:
+    """直接用 orjson 序列化响应模型
+
+    模型由 model_construct 构建且字段都来自本模块，返回 Response 可跳过 FastAPI 按 response_model
+    对嵌套AST数据的再次校验和序列化；response_model 仍保留用于生成接口文档
+    """
+    data = dict(model)
+    try:
+        content = orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # orjson 不支持超出64位的整数（如AST常量 0xFFFFFFFFFFFFFFFFFFFF），且不会对其调用 default，
+        # 此时退回标准库 json 序列化
+        content = json.dumps(data, default=_json_default, ensure_ascii=False).encode('utf-8')
+    return Response(content=content, media_type="application/json")
+
+# ASTAnalyzer 在每次 analyze 开始时重置内部状态，且只在事件循环线程中同步调用，可全局复用
+_ast_analyzer = ASTAnalyzer()
+
+@lru_cache(maxsize=128)
+def _analyze_code(code: str) -> Dict[str, Any]:
+    """分析代码并在进程内缓存结果，重复提交的相同代码不再重复解析
+
+    返回的结果在多个请求间共享，调用方不得修改
+    """
+    return _ast_analyzer.analyze(code)
+
+# 正在进行的分析任务，按 (code_hash, use_llm, use_cache, save_to_memory) 合并并发的相同请求
+_inflight_analyses: Dict[Tuple[str, bool, bool, bool], asyncio.Task] = {}
+
+def _finish_inflight_analysis(inflight_key: Tuple[str, bool, bool, bool], task: asyncio.Task):
+    """分析任务结束时移出合并表，并取出任务异常
+
+    等待该任务的请求都已断开时没有人获取异常，这里显式取出异常以免出现 "Task exception was never retrieved"，不依赖 asyncio.shield 的内部行为；
+    仍在等待的请求各自收到同一个异常
+    """
+    _inflight_analyses.pop(inflight_key, None)
+    if not task.cancelled():
+        task.exception()
+
+# 语义缓存：MinHash估计的相似度达到该阈值时复用已缓存的变量类型推断结果
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# 记忆库命中时直接复用推断结果所需的最低置信度
+MEMORY_HIT_CONFIDENCE = 0.8
+
+async def _infer_variable_types_with_memory(code: str, undeclared_vars: List[Dict[str, Any]],
+                                            use_memory: bool = True, save_to_memory: bool = True) -> Dict[str, Any]:
+    """推断未声明变量类型，优先复用记忆库中相同代码的高置信度结果，未命中时才调用LLM"""
+    pattern_hash = generate_code_pattern_hash(code)
+    
+    if use_memory:
+        hit = await asyncio.to_thread(get_memory_pattern_by_hash, pattern_hash)
+        if hit and hit["inferred_types"] and (hit["confidence_score"] or 0) >= MEMORY_HIT_CONFIDENCE:
+            logger.info(f"从记忆库中获取类型推断结果: {pattern_hash}")
+            return {
+                "success": True,
+                "inferences": hit["inferred_types"],
+                "explanations": {},
+                "confidence": {name: hit["confidence_score"] for name in hit["inferred_types"]},
+                "cached": True
+            }
+    
+    result = await llm_client.infer_variable_types(code, undeclared_vars)
+    
+    # 成功推断后写入记忆库，供后续相同代码直接复用
+    if save_to_memory and result.get("success") and result.get("inferences"):
+        scores = [c for c in result.get("confidence", {}).values() if isinstance(c, (int, float))]
+        confidence_score = statistics.fmean(scores) if scores else 0.5
+        try:
+            await asyncio.to_thread(
+                save_memory_pattern, pattern_hash, code, result["inferences"], confidence_score
+            )
+        except Exception as e:
+            logger.error(f"保存类型推断到记忆库失败: {str(e)}")
+    
+    return result
+
+def _find_semantic_inferences(code: str, variable_names: Set[str]) -> Tuple[List[int], Optional[Dict[str, Any]]]:
+    """计算代码签名，并从足够相似的分析记录中复用当前未声明变量的类型推断（同步函数，在线程池中调用）
+
+    只复用逐变量的推断结果：被复用记录的推断必须覆盖 variable_names 中的全部变量，且只返回这些变量的结果。
+    函数注解和代码质量与具体代码相关，不从近似代码复用。本身来自语义复用的推断不会被再次复用。
+
+    Returns:
+        (签名, 带 semantic 标记的类型推断结果或 None)
+    """
+    signature = compute_code_signature(code)
+    if not variable_names:
+        return signature, None
+    
+    candidates = []
+    for candidate_hash, candidate_signature in get_signature_candidates(signature_band_keys(signature)).items():
+        similarity = signature_similarity(signature, candidate_signature)
+        if similarity >= SEMANTIC_CACHE_THRESHOLD:
+            candidates.append((similarity, candidate_hash))
+    
+    for similarity, candidate_hash in sorted(candidates, reverse=True):
+        record = get_analysis_record(candidate_hash)
+        if not record:
+            continue
+        type_inference = record["llm_suggestions"].get("type_inference") or {}
+        inferences = type_inference.get("inferences") or {}
+        # 近似代码的变量名可能不同（如 total_count 与 item_limit），推断结果未覆盖当前变量时不能复用
+        if (not type_inference.get("success") or type_inference.get("semantic")
+                or not variable_names.issubset(inferences)):
+            continue
+        
+        logger.info(f"语义缓存命中: {candidate_hash} (相似度 {similarity:.2f})")
+        explanations = type_inference.get("explanations") or {}
+        confidence = type_inference.get("confidence") or {}
+        return signature, {
+            "success": True,
+            "inferences": {name: inferences[name] for name in variable_names},
+            "explanations": {name: explanations[name] for name in variable_names if name in explanations},
+            "confidence": {name: confidence[name] for name in variable_names if name in confidence},
+            "cached": True,
+            "semantic": True,
+            "source_code_hash": candidate_hash
+        }
+    
+    return signature, None
+
+def _save_code_signature(code_hash: str, code: str, signature: Optional[List[int]]):
+    """保存代码签名，未在语义缓存查找中计算过签名时在此计算（同步函数，在线程池中调用）"""
+    if signature is None:
+        signature = compute_code_signature(code)
+    save_analysis_signature(code_hash, signature, signature_band_keys(signature))
+
+async def _run_code_analysis(request: CodeAnalysisRequest, code_hash: str) -> CodeAnalysisResponse:
+    """执行缓存未命中时的完整分析：AST分析、LLM分析并保存结果"""
+    # 执行AST分析
+    ast_result = _analyze_code(request.code)
+    
+    if not ast_result["success"]:
+        return CodeAnalysisResponse.model_construct(
+            success=False,
+            code_hash=code_hash,
+            error=ast_result["error"]
+        )
+    
+    # 分析未声明变量
+    type_inferrer = TypeInferrer()
+    undeclared_vars = type_inferrer.analyze_undeclared_variables(
+        request.code, ast_result["symbol_table"]
+    )
+    
+    type_inference_result = {
+        "undeclared_variables": undeclared_vars,
+        "patterns": extract_code_patterns(request.code)
+    }
+    
+    signature = None
+    
+    llm_suggestions = {}
+    type_annotations = {}
+    code_quality = {}
+    
+    semantic_inference = None
+    
+    # 如果启用了LLM分析
+    if request.use_llm:
+        # 精确缓存未命中时，优先复用近似重复代码中相同变量的类型推断结果
+        if request.use_cache and undeclared_vars:
+            signature, semantic_inference = await asyncio.to_thread(
+                _find_semantic_inferences, request.code, {var["name"] for var in undeclared_vars}
+            )
+        
+        # 类型推断、注解建议和质量分析互不依赖，并发调用LLM；注解和质量分析始终针对当前代码
+        llm_tasks = {}
+        if undeclared_vars and not semantic_inference:
+            llm_tasks["type_inference"] = _infer_variable_types_with_memory(
+                request.code, undeclared_vars,
+                use_memory=request.use_cache, save_to_memory=request.save_to_memory
+            )
+        llm_tasks["type_annotations"] = llm_client.suggest_type_annotations(
+            request.code, ast_result["symbol_table"]
+        )
+        llm_tasks["code_quality"] = llm_client.analyze_code_quality(request.code)
+        
+        if semantic_inference:
+            llm_suggestions["type_inference"] = semantic_inference
+        
+        llm_results = await asyncio.gather(*llm_tasks.values(), return_exceptions=True)
+        for task_name, result in zip(llm_tasks, llm_results):
+            if isinstance(result, BaseException):
+                logger.error(f"LLM分析失败: {str(result)}")
+                llm_suggestions["error"] = f"LLM分析失败: {str(result)}"
+            else:
+                llm_suggestions[task_name] = result
+        
+        # 保存类型推导历史（记忆库命中和语义复用的结果不重复记录）
+        type_inference = llm_suggestions.get("type_inference", {})
+        if (type_inference.get("success") and not type_inference.get("cached")
+                and request.save_to_memory):
+            try:
+                confidences = type_inference.get("confidence", {})
+                await asyncio.to_thread(save_type_inference_history_many, [
+                    (var_name, request.code, "unknown", inferred_type,
+                     inferred_type, confidences.get(var_name, 0.5), "llm_inferred")
+                    for var_name, inferred_type in type_inference.get("inferences", {}).items()
+                ])
+            except Exception as e:
+                logger.error(f"保存类型推导历史失败: {str(e)}")
+        
+        type_annotations = llm_suggestions.get("type_annotations", {})
+        code_quality = llm_suggestions.get("code_quality", {})
+    
+    # 保存到数据库（语义复用的类型推断带有 semantic 标记保存，不会被当作当前代码的完整推断再次复用）
+    try:
+        await save_analysis_record_async(
+            code_hash, request.code, ast_result["ast"],
+            ast_result["symbol_table"], type_inference_result, llm_suggestions
+        )
+        await asyncio.to_thread(_save_code_signature, code_hash, request.code, signature)
+        
+        # 保存到记忆库（语义复用的推断来自其他代码，不写入记忆库）
+        if request.save_to_memory and type_inference_result.get("patterns") and not semantic_inference:
+            inferences = llm_suggestions.get("type_inference", {}).get("inferences", {})
+            await asyncio.to_thread(save_memory_patterns_many, [
+                (generate_pattern_hash(pattern), pattern, inferences, 0.8)  # 默认置信度
+                for pattern in type_inference_result["patterns"]
+            ])
+    except Exception as e:
+        logger.error(f"保存分析结果失败: {str(e)}")
+    
+    return CodeAnalysisResponse.model_construct(
+        success=True,
+        code_hash=code_hash,
+        ast_data=ast_result["ast"],
+        symbol_table=ast_result["symbol_table"],
+        undeclared_variables=undeclared_vars,
+        llm_suggestions=llm_suggestions,
+        type_annotations=type_annotations,
+        code_quality=code_quality,
+        cached=False,
+        semantic=semantic_inference is not None
+    )
+
 @router.post("/analyze", response_model=CodeAnalysisResponse)
 async def analyze_code(request: CodeAnalysisRequest):
     """分析Python代码"""
     try:
-        code_hash = generate_code_hash(request.code)
+        # 统一换行符后计算哈希，仅换行符不同的相同代码共享缓存
+        code_hash = generate_code_hash(normalize_code(request.code))
         
         # 检查缓存（仅在启用缓存时）
         if request.use_cache:
-            cached_result = get_analysis_record(code_hash)
+            cached_result = await asyncio.to_thread(get_analysis_record, code_hash)
             if cached_result:
                 logger.info(f"从缓存中获取分析结果: {code_hash}")
-                return CodeAnalysisResponse(
+                return _json_response(CodeAnalysisResponse.model_construct(
                     success=True,
                     code_hash=code_hash,
                     ast_data=cached_result["ast_data"],
                     symbol_table=cached_result["symbol_table"],
                     undeclared_variables=cached_result["type_inference"].get("undeclared_variables", []),
                     llm_suggestions=cached_result["llm_suggestions"],
-                    cached=True
-                )
+                    cached=True,
+                    semantic=bool(cached_result["llm_suggestions"].get("type_inference", {}).get("semantic"))
+                ))
         else:
             logger.info(f"跳过缓存，重新分析代码: {code_hash}")
         
-        # 执行AST分析
-        analyzer = ASTAnalyzer()
-        ast_result = analyzer.analyze(request.code)
-        
-        if not ast_result["success"]:
-            return CodeAnalysisResponse(
-                success=False,
-                code_hash=code_hash,
-                error=ast_result["error"]
-            )
-        
-        # 分析未声明变量
-        type_inferrer = TypeInferrer()
-        undeclared_vars = type_inferrer.analyze_undeclared_variables(
-            request.code, ast_result["symbol_table"]
-        )
-        
-        type_inference_result = {
-            "undeclared_variables": undeclared_vars,
-            "patterns": extract_code_patterns(request.code)
-        }
+        # 相同请求正在分析时直接等待该任务的结果，避免并发的重复请求各自调用LLM
+        inflight_key = (code_hash, request.use_llm, request.use_cache, request.save_to_memory)
+        task = _inflight_analyses.get(inflight_key)
+        if task is None:
+            task = asyncio.create_task(_run_code_analysis(request, code_hash))
+            _inflight_analyses[inflight_key] = task
+            task.add_done_callback(partial(_finish_inflight_analysis, inflight_key))
         
-        llm_suggestions = {}
-        type_annotations = {}
-        code_quality = {}
-        
-        # 如果启用了LLM分析
-        if request.use_llm:
-            try:
-                # 推断未声明变量类型
-                if undeclared_vars:
-                    type_inference = await llm_client.infer_variable_types(
-                        request.code, undeclared_vars
-                    )
-                    llm_suggestions["type_inference"] = type_inference
-                    
-                    # 保存类型推导历史
-                    if type_inference.get("success") and request.save_to_memory:
-                        for var_name, inferred_type in type_inference.get("inferences", {}).items():
-                            save_type_inference_history(
-                                var_name, request.code, "unknown", inferred_type,
-                                inferred_type, type_inference.get("confidence", {}).get(var_name, 0.5),
-                                "llm_inferred"
-                            )
-                
-                # 建议类型注解
-                annotations = await llm_client.suggest_type_annotations(
-                    request.code, ast_result["symbol_table"]
-                )
-                type_annotations = annotations
-                
-                # 分析代码质量
-                quality = await llm_client.analyze_code_quality(request.code)
-                code_quality = quality
-                
-                llm_suggestions.update({
-                    "type_annotations": annotations,
-                    "code_quality": quality
-                })
-                
-            except Exception as e:
-                logger.error(f"LLM分析失败: {str(e)}")
-                llm_suggestions["error"] = f"LLM分析失败: {str(e)}"
-        
-        # 保存到数据库
-        try:
-            save_analysis_record(
-                code_hash, request.code, ast_result["ast"],
-                ast_result["symbol_table"], type_inference_result, llm_suggestions
-            )
-            
-            # 保存到记忆库
-            if request.save_to_memory and type_inference_result.get("patterns"):
-                for pattern in type_inference_result["patterns"]:
-                    pattern_hash = hashlib.md5(pattern.encode('utf-8')).hexdigest()
-                    save_memory_pattern(
-                        pattern_hash, pattern,
-                        llm_suggestions.get("type_inference", {}).get("inferences", {}),
-                        0.8  # 默认置信度
-                    )
-        except Exception as e:
-            logger.error(f"保存分析结果失败: {str(e)}")
-        
-        return CodeAnalysisResponse(
-            success=True,
-            code_hash=code_hash,
-            ast_data=ast_result["ast"],
-            symbol_table=ast_result["symbol_table"],
-            undeclared_variables=undeclared_vars,
-            llm_suggestions=llm_suggestions,
-            type_annotations=type_annotations,
-            code_quality=code_quality,
-            cached=False
-        )
+        # shield：某个客户端断开导致请求被取消时，不取消其他请求共享的分析任务
+        return _json_response(await asyncio.shield(task))
         
     except Exception as e:
         logger.error(f"代码分析失败: {str(e)}")
@@ -190,162 +364,189 @@ async def get_analysis_status():
             }
         }
 
+# AST可视化时优先展开的字段（按顺序）
+AST_IMPORTANT_FIELDS = [
+    'body', 'orelse', 'finalbody',  # 代码块
+    'left', 'right', 'op',          # 二元操作
+    'test', 'comparators', 'ops',   # 比较和测试
+    'targets', 'value',             # 赋值
+    'func', 'args', 'keywords',     # 函数调用
+    'iter', 'target',               # 循环
+    'elts', 'keys', 'values',       # 容器类型
+    'name', 'bases', 'decorator_list'  # 定义类型
+]
+
+# 不需要作为其他字段展开的字段：重要字段已单独处理，位置信息不是子节点
+AST_NON_CHILD_FIELDS = frozenset(AST_IMPORTANT_FIELDS) | frozenset(
+    ["node_type", "lineno", "col_offset", "end_lineno", "end_col_offset"]
+)
+
+# AST可视化的最大深度，更深的节点不再展开
+AST_MAX_DEPTH = 20
+
+def _const_label(node: Dict[str, Any]) -> Optional[str]:
+    """常量节点标签，过长的值会被截断"""
+    if 'value' not in node:
+        return None
+    value_str = str(node['value'])
+    if len(value_str) > 15:
+        value_str = value_str[:12] + "..."
+    return f"Const: {value_str}"
+
+def _binop_label(node: Dict[str, Any]) -> Optional[str]:
+    """二元运算节点标签"""
+    op_type = node.get('op', {}).get('node_type', '')
+    return f"BinOp: {op_type}" if op_type else None
+
+def _call_label(node: Dict[str, Any]) -> Optional[str]:
+    """函数调用节点标签，仅处理直接按名称调用的情况"""
+    func_info = node.get('func')
+    if isinstance(func_info, dict) and func_info.get('node_type') == 'Name':
+        return f"Call: {func_info.get('id', 'func')}"
+    return None
+
+def _assign_label(node: Dict[str, Any]) -> Optional[str]:
+    """赋值节点标签，仅处理第一个目标是变量名的情况"""
+    targets = node.get('targets')
+    if targets and isinstance(targets[0], dict) and targets[0].get('node_type') == 'Name':
+        return f"Assign: {targets[0].get('id', 'var')}"
+    return None
+
+# 节点类型 -> 标签生成函数，返回None时使用节点类型名作为标签
+AST_LABEL_BUILDERS = {
+    'Name': lambda node: f"Name: {node['id']}" if 'id' in node else None,
+    'Constant': _const_label,
+    'FunctionDef': lambda node: f"Func: {node['name']}" if 'name' in node else None,
+    'ClassDef': lambda node: f"Class: {node['name']}" if 'name' in node else None,
+    'BinOp': _binop_label,
+    'Call': _call_label,
+    'Attribute': lambda node: f"Attr: {node['attr']}" if 'attr' in node else None,
+    'Assign': _assign_label,
+}
+
+def _build_ast_visualization(ast_data: Any) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    将AST字典转换为可视化格式
+    
+    使用显式栈做一次前序遍历，节点编号、层级和输出顺序与逐层递归展开一致。
+    
+    Args:
+        ast_data: 根AST节点（字典格式）
+        
+    Returns:
+        (nodes, edges): 节点列表和边列表
+    """
+    # 遍历时只按列记录节点属性（节点编号即其在各列中的序号+1），遍历结束后再统一生成字典
+    node_types = []
+    node_labels = []
+    node_lines = []
+    node_cols = []
+    node_levels = []
+    node_parents = []  # 父节点编号，根节点为0
+    stack = [(ast_data, 0, 0)]  # (节点, 父节点编号, 层级)
+    
+    while stack:
+        node, parent_index, depth = stack.pop()
+        if not isinstance(node, dict) or depth > AST_MAX_DEPTH:  # 防止过深的树
+            continue
+        
+        node_type = node.get('node_type', 'Unknown')
+        
+        # 按节点类型生成标签，没有专用规则时使用节点类型名
+        label_builder = AST_LABEL_BUILDERS.get(node_type)
+        
+        node_types.append(node_type)
+        node_labels.append((label_builder(node) if label_builder else None) or node_type)
+        node_lines.append(node.get("lineno"))
+        node_cols.append(node.get("col_offset"))
+        node_levels.append(depth)
+        node_parents.append(parent_index)
+        node_index = len(node_types)
+        
+        # 收集子节点：先处理重要字段，再处理其他字段
+        field_names = [field for field in AST_IMPORTANT_FIELDS if field in node]
+        field_names.extend(field for field in node.keys() if field not in AST_NON_CHILD_FIELDS)
+        
+        children = []
+        for field_name in field_names:
+            field_value = node[field_name]
+            if isinstance(field_value, list):
+                children.extend(
+                    item for item in field_value
+                    if isinstance(item, dict) and "node_type" in item
+                )
+            elif isinstance(field_value, dict) and "node_type" in field_value:
+                children.append(field_value)
+        
+        # 逆序入栈，保证按原顺序出栈
+        child_depth = depth + 1
+        stack.extend((child, node_index, child_depth) for child in reversed(children))
+    
+    # 生成唯一ID - 按遍历顺序编号确保唯一性
+    node_ids = [f"node_{index}" for index in range(1, len(node_types) + 1)]
+    parent_ids = [node_ids[parent - 1] if parent else None for parent in node_parents]
+    
+    nodes = [
+        {
+            "id": node_id,
+            "label": label,
+            "type": node_type,
+            "line": line,
+            "col": col,
+            "level": level,
+            "parent_id": parent_id
+        }
+        for node_id, label, node_type, line, col, level, parent_id in zip(
+            node_ids, node_labels, node_types, node_lines, node_cols, node_levels, parent_ids
+        )
+    ]
+    
+    # 添加边（父子关系）
+    edges = [
+        {
+            "from": parent_id,
+            "to": node_id,
+            "id": f"edge_{parent_id}_to_{node_id}"
+        }
+        for node_id, parent_id in zip(node_ids, parent_ids)
+        if parent_id
+    ]
+    
+    return nodes, edges
+
+def _ast_visualization_response(payload: bytes) -> Response:
+    """将缓存的可视化JSON（对象）直接拼接上 success 字段返回，避免反序列化再序列化"""
+    return Response(content=b'{"success":true,' + payload[1:], media_type="application/json")
+
 @router.get("/ast/{code_hash}")
 async def get_ast_visualization(code_hash: str):
     """获取AST可视化数据"""
     try:
-        record = get_analysis_record(code_hash)
+        # 同一代码哈希的AST不会变化，优先使用可视化缓存
+        cached_payload = await asyncio.to_thread(get_ast_visualization_cache, code_hash)
+        if cached_payload:
+            return _ast_visualization_response(cached_payload)
+        
+        record = await asyncio.to_thread(get_analysis_record, code_hash)
         if not record:
             raise HTTPException(status_code=404, detail="分析记录不存在")
         
         ast_data = record["ast_data"]
         
-        # 转换为可视化格式 - 重新设计确保level正确设置
-        node_counter = [0]  # 使用列表以便在嵌套函数中修改
-        
-        def convert_for_visualization(node, parent_id=None, depth=0):
-            """
-            递归转换AST节点为可视化格式
-            
-            Args:
-                node: AST节点
-                parent_id: 父节点ID
-                depth: 当前深度/层级
-                
-            Returns:
-                (nodes, edges): 节点列表和边列表
-            """
-            if not isinstance(node, dict) or depth > 20:  # 防止过深的递归
-                return [], []
-            
-            nodes = []
-            edges = []
-            
-            # 生成唯一ID - 使用全局计数器确保唯一性
-            node_type = node.get('node_type', 'Unknown')
-            node_counter[0] += 1
-            node_id = f"node_{node_counter[0]}"  # 简化ID生成，确保绝对唯一
-            
-            # 优化节点标签显示
-            node_label = node_type
-            
-            # 为特定节点类型添加更多信息
-            if node_type == 'Name' and 'id' in node:
-                node_label = f"Name: {node['id']}"
-            elif node_type == 'Constant' and 'value' in node:
-                value_str = str(node['value'])
-                if len(value_str) > 15:
-                    value_str = value_str[:12] + "..."
-                node_label = f"Const: {value_str}"
-            elif node_type == 'FunctionDef' and 'name' in node:
-                node_label = f"Func: {node['name']}"
-            elif node_type == 'ClassDef' and 'name' in node:
-                node_label = f"Class: {node['name']}"
-            elif node_type == 'BinOp':
-                op_type = node.get('op', {}).get('node_type', '')
-                if op_type:
-                    node_label = f"BinOp: {op_type}"
-            elif node_type == 'Call' and 'func' in node:
-                func_info = node['func']
-                if isinstance(func_info, dict) and func_info.get('node_type') == 'Name':
-                    node_label = f"Call: {func_info.get('id', 'func')}"
-            elif node_type == 'Attribute' and 'attr' in node:
-                node_label = f"Attr: {node['attr']}"
-            elif node_type == 'Assign' and 'targets' in node:
-                targets = node['targets']
-                if targets and isinstance(targets[0], dict) and targets[0].get('node_type') == 'Name':
-                    node_label = f"Assign: {targets[0].get('id', 'var')}"
-            
-            # 创建当前节点
-            current_node = {
-                "id": node_id,
-                "label": node_label,
-                "type": node_type,
-                "line": node.get("lineno"),
-                "col": node.get("col_offset"),
-                "level": depth,  # 明确设置层级
-                "parent_id": parent_id
-            }
-            nodes.append(current_node)
-            
-            # 添加边（父子关系）
-            if parent_id:
-                edges.append({
-                    "from": parent_id,
-                    "to": node_id,
-                    "id": f"edge_{parent_id}_to_{node_id}"
-                })
-            
-            # 处理子节点 - 按照AST的重要字段顺序
-            child_depth = depth + 1
-            important_fields = [
-                'body', 'orelse', 'finalbody',  # 代码块
-                'left', 'right', 'op',          # 二元操作
-                'test', 'comparators', 'ops',   # 比较和测试
-                'targets', 'value',             # 赋值
-                'func', 'args', 'keywords',     # 函数调用
-                'iter', 'target',               # 循环
-                'elts', 'keys', 'values',       # 容器类型
-                'name', 'bases', 'decorator_list'  # 定义类型
-            ]
-            
-            # 首先处理重要字段
-            for field_name in important_fields:
-                if field_name in node:
-                    field_value = node[field_name]
-                    child_nodes, child_edges = process_ast_field(
-                        field_name, field_value, node_id, child_depth
-                    )
-                    nodes.extend(child_nodes)
-                    edges.extend(child_edges)
-            
-            # 然后处理其他字段
-            other_fields = [field for field in node.keys() 
-                          if field not in important_fields 
-                          and field not in ["node_type", "lineno", "col_offset", "end_lineno", "end_col_offset"]]
-            
-            for field_name in other_fields:
-                field_value = node[field_name]
-                child_nodes, child_edges = process_ast_field(
-                    field_name, field_value, node_id, child_depth
-                )
-                nodes.extend(child_nodes)
-                edges.extend(child_edges)
-            
-            return nodes, edges
-        
-        def process_ast_field(field_name, field_value, parent_id, depth):
-            """处理AST字段，生成子节点"""
-            nodes = []
-            edges = []
-            
-            if isinstance(field_value, list):
-                # 处理列表类型的字段
-                for i, item in enumerate(field_value):
-                    if isinstance(item, dict) and "node_type" in item:
-                        child_nodes, child_edges = convert_for_visualization(
-                            item, parent_id, depth
-                        )
-                        nodes.extend(child_nodes)
-                        edges.extend(child_edges)
-            elif isinstance(field_value, dict) and "node_type" in field_value:
-                # 处理单个AST节点
-                child_nodes, child_edges = convert_for_visualization(
-                    field_value, parent_id, depth
-                )
-                nodes.extend(child_nodes)
-                edges.extend(child_edges)
-            
-            return nodes, edges
-        
-        nodes, edges = convert_for_visualization(ast_data)
+        # 转换为可视化格式
+        nodes, edges = _build_ast_visualization(ast_data)
         
-        return {
-            "success": True,
+        payload = orjson.dumps({
             "nodes": nodes,
             "edges": edges,
             "original_code": record["original_code"]
-        }
+        })
+        try:
+            await asyncio.to_thread(save_ast_visualization, code_hash, payload)
+        except Exception as e:
+            logger.error(f"保存AST可视化缓存失败: {str(e)}")
+        
+        return _ast_visualization_response(payload)
         
     except HTTPException:
         raise
@@ -353,11 +554,19 @@ async def get_ast_visualization(code_hash: str):
         logger.error(f"获取AST可视化数据失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取AST可视化数据失败: {str(e)}")
 
+# 符号表可视化中的符号分组：(符号表中的键, 符号ID前缀, 符号类型)
+SYMBOL_TABLE_SECTIONS = [
+    ("functions", "func_", "function"),
+    ("classes", "class_", "class"),
+    ("variables", "var_", "variable"),
+    ("imports", "import_", "import"),
+]
+
 @router.get("/symbol-table/{code_hash}")
 async def get_symbol_table_visualization(code_hash: str):
     """获取符号表可视化数据"""
     try:
-        record = get_analysis_record(code_hash)
+        record = await asyncio.to_thread(get_analysis_record, code_hash)
         if not record:
             raise HTTPException(status_code=404, detail="分析记录不存在")
         
@@ -380,53 +589,19 @@ async def get_symbol_table_visualization(code_hash: str):
                 "symbols": list(global_scope.keys())
             })
         
-        # 函数
-        functions = symbol_table.get("functions", {})
-        for func_name, func_info in functions.items():
-            visualization_data["symbols"].append({
-                "id": f"func_{func_name}",
-                "name": func_name,
-                "type": "function",
-                "scope": "global",
-                "line": func_info.get("lineno"),
-                "details": func_info
-            })
-        
-        # 类
-        classes = symbol_table.get("classes", {})
-        for class_name, class_info in classes.items():
-            visualization_data["symbols"].append({
-                "id": f"class_{class_name}",
-                "name": class_name,
-                "type": "class",
-                "scope": "global",
-                "line": class_info.get("lineno"),
-                "details": class_info
-            })
-        
-        # 变量
-        variables = symbol_table.get("variables", {})
-        for var_name, var_info in variables.items():
-            visualization_data["symbols"].append({
-                "id": f"var_{var_name}",
-                "name": var_name,
-                "type": "variable",
-                "scope": f"scope_{var_info.get('scope', 0)}",
-                "line": var_info.get("lineno"),
-                "details": var_info
-            })
-        
-        # 导入
-        imports = symbol_table.get("imports", {})
-        for import_name, import_info in imports.items():
-            visualization_data["symbols"].append({
-                "id": f"import_{import_name}",
-                "name": import_name,
-                "type": "import",
-                "scope": "global",
-                "line": import_info.get("lineno"),
-                "details": import_info
-            })
+        # 函数、类、变量、导入：按 SYMBOL_TABLE_SECTIONS 的顺序一次生成全部符号
+        visualization_data["symbols"] = [
+            {
+                "id": f"{id_prefix}{name}",
+                "name": name,
+                "type": symbol_type,
+                "scope": f"scope_{info.get('scope', 0)}" if symbol_type == "variable" else "global",
+                "line": info.get("lineno"),
+                "details": info
+            }
+            for section, id_prefix, symbol_type in SYMBOL_TABLE_SECTIONS
+            for name, info in symbol_table.get(section, {}).items()
+        ]
         
         return {
             "success": True,
@@ -444,27 +619,11 @@ async def get_symbol_table_visualization(code_hash: str):
 async def clear_all_cache():
     """清除所有分析缓存"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # 清除分析记录表
-        cursor.execute("DELETE FROM analysis_records")
-        analysis_count = cursor.rowcount
-        
-        # 清除类型推导历史表  
-        cursor.execute("DELETE FROM type_inference_history")
-        inference_count = cursor.rowcount
-        
-        # 清除记忆库模式表
-        cursor.execute("DELETE FROM memory_store")
-        memory_count = cursor.rowcount
-        
-        # 清除类型注解缓存表
-        cursor.execute("DELETE FROM type_annotation_cache")
-        annotation_count = cursor.rowcount
-        
-        conn.commit()
-        conn.close()
+        cleared = await asyncio.to_thread(clear_all_caches)
+        analysis_count = cleared["analysis_records"]
+        inference_count = cleared["type_inference_history"]
+        memory_count = cleared["memory_store"]
+        annotation_count = cleared["type_annotation_cache"]
         
         logger.info(f"清除缓存完成 - 分析记录: {analysis_count}, 推导历史: {inference_count}, 记忆模式: {memory_count}, 类型注解: {annotation_count}")
         
@@ -488,27 +647,20 @@ async def clear_all_cache():
 async def clear_specific_cache(code_hash: str):
     """清除特定代码的缓存"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # 清除特定代码的分析记录
-        cursor.execute("DELETE FROM analysis_records WHERE code_hash = ?", (code_hash,))
-        analysis_count = cursor.rowcount
+        # 记忆库按整段代码保存类型推断结果，需要由原始代码计算其键后一并清除
+        original_code = await asyncio.to_thread(get_cached_original_code, code_hash)
+        pattern_hash = generate_code_pattern_hash(original_code) if original_code is not None else None
         
-        # 清除特定代码的类型注解缓存
-        cursor.execute("DELETE FROM type_annotation_cache WHERE code_hash = ?", (code_hash,))
-        annotation_count = cursor.rowcount
+        cleared = await asyncio.to_thread(clear_code_caches, code_hash, pattern_hash)
+        analysis_count = cleared["analysis_records"]
+        annotation_count = cleared["type_annotation_cache"]
         
         total_cleared = analysis_count + annotation_count
         
         if total_cleared == 0:
-            conn.close()
             raise HTTPException(status_code=404, detail="未找到指定的缓存记录")
         
-        conn.commit()
-        conn.close()
-        
-        logger.info(f"清除特定缓存完成 - 代码哈希: {code_hash}, 分析记录: {analysis_count}, 类型注解: {annotation_count}")
+        logger.info(f"清除特定缓存完成 - 代码哈希: {code_hash}, 分析记录: {analysis_count}, 类型注解: {annotation_count}, 记忆模式: {cleared['memory_store']}")
         
         return {
             "success": True,
@@ -517,6 +669,7 @@ async def clear_specific_cache(code_hash: str):
             "details": {
                 "analysis_records_cleared": analysis_count,
                 "type_annotations_cleared": annotation_count,
+                "memory_patterns_cleared": cleared["memory_store"],
                 "total_cleared": total_cleared
             }
         }
@@ -531,55 +684,12 @@ async def clear_specific_cache(code_hash: str):
 async def get_cache_stats():
     """获取缓存统计信息"""
     try:
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        
-        # 统计分析记录
-        cursor.execute("SELECT COUNT(*) FROM analysis_records")
-        analysis_count = cursor.fetchone()[0]
-        
-        # 统计类型推导历史
-        cursor.execute("SELECT COUNT(*) FROM type_inference_history")
-        inference_count = cursor.fetchone()[0]
-        
-        # 统计记忆库模式
-        cursor.execute("SELECT COUNT(*) FROM memory_store")
-        memory_count = cursor.fetchone()[0]
-        
-        # 统计类型注解缓存
-        cursor.execute("SELECT COUNT(*) FROM type_annotation_cache")
-        annotation_count = cursor.fetchone()[0]
-        
-        # 获取最近的分析记录
-        cursor.execute("""
-            SELECT code_hash, created_at 
-            FROM analysis_records 
-            ORDER BY created_at DESC 
-            LIMIT 5
-        """)
-        recent_records = [
-            {"code_hash": row[0], "created_at": row[1], "type": "analysis"} 
-            for row in cursor.fetchall()
-        ]
-        
-        # 获取最近的类型注解记录
-        cursor.execute("""
-            SELECT code_hash, created_at 
-            FROM type_annotation_cache 
-            ORDER BY created_at DESC 
-            LIMIT 3
-        """)
-        recent_annotations = [
-            {"code_hash": row[0], "created_at": row[1], "type": "annotation"} 
-            for row in cursor.fetchall()
-        ]
-        
-        # 合并最近记录
-        all_recent = recent_records + recent_annotations
-        all_recent.sort(key=lambda x: x["created_at"], reverse=True)
-        all_recent = all_recent[:5]  # 取最近5条
-        
-        conn.close()
+        stats = await asyncio.to_thread(get_cache_statistics)
+        analysis_count = stats["counts"]["analysis_records"]
+        inference_count = stats["counts"]["type_inference_history"]
+        memory_count = stats["counts"]["memory_store"]
+        annotation_count = stats["counts"]["type_annotation_cache"]
+        all_recent = stats["recent_records"]
         
         return {
             "success": True,
@@ -601,11 +711,11 @@ async def get_cache_stats():
 async def generate_type_annotations(request: CodeAnalysisRequest):
     """生成带类型注解的代码"""
     try:
-        code_hash = generate_code_hash(request.code)
+        code_hash = generate_code_hash(normalize_code(request.code))
         
         # 检查缓存（仅在启用缓存时）
         if request.use_cache:
-            cached_result = get_type_annotation_cache(code_hash, request.use_llm)
+            cached_result = await asyncio.to_thread(get_type_annotation_cache, code_hash, request.use_llm)
             if cached_result:
                 logger.info(f"从缓存中获取类型注解结果: {code_hash}")
                 return {
@@ -622,39 +732,62 @@ async def generate_type_annotations(request: CodeAnalysisRequest):
         else:
             logger.info(f"跳过缓存，重新生成类型注解: {code_hash}")
         
-        # 首先进行完整分析
-        analyzer = ASTAnalyzer()
-        ast_result = analyzer.analyze(request.code)
+        # 同一代码已有分析记录时直接复用其符号表和未声明变量，否则进行完整分析
+        prior_record = None
+        if request.use_cache:
+            prior_record = await asyncio.to_thread(get_analysis_record, code_hash)
         
-        if not ast_result["success"]:
-            return {
-                "success": False,
-                "error": ast_result["error"]
-            }
+        if prior_record:
+            symbol_table = prior_record["symbol_table"]
+            undeclared_vars = prior_record["type_inference"].get("undeclared_variables")
+        else:
+            ast_result = _analyze_code(request.code)
+            
+            if not ast_result["success"]:
+                return {
+                    "success": False,
+                    "error": ast_result["error"]
+                }
+            
+            symbol_table = ast_result["symbol_table"]
+            undeclared_vars = None
         
         # 获取LLM的类型建议
         type_suggestions = {}
         if request.use_llm:
             try:
                 # 分析未声明变量
-                type_inferrer = TypeInferrer()
-                undeclared_vars = type_inferrer.analyze_undeclared_variables(
-                    request.code, ast_result["symbol_table"]
-                )
+                if undeclared_vars is None:
+                    type_inferrer = TypeInferrer()
+                    undeclared_vars = type_inferrer.analyze_undeclared_variables(
+                        request.code, symbol_table
+                    )
                 
-                # 获取LLM类型推断
+                # 类型推断和注解建议互不依赖，并发调用LLM
+                llm_tasks = {}
                 if undeclared_vars:
-                    inference_result = await llm_client.infer_variable_types(
-                        request.code, undeclared_vars
+                    llm_tasks["inference"] = _infer_variable_types_with_memory(
+                        request.code, undeclared_vars,
+                        use_memory=request.use_cache, save_to_memory=request.save_to_memory
                     )
-                    if inference_result.get("success"):
-                        type_suggestions.update(inference_result)
+                llm_tasks["annotation"] = llm_client.suggest_type_annotations(
+                    request.code, symbol_table
+                )
+                llm_results = dict(zip(
+                    llm_tasks, await asyncio.gather(*llm_tasks.values(), return_exceptions=True)
+                ))
+                for result in llm_results.values():
+                    if isinstance(result, BaseException):
+                        logger.error(f"LLM类型推断失败: {str(result)}")
+                
+                # 获取LLM类型推断
+                inference_result = llm_results.get("inference")
+                if isinstance(inference_result, dict) and inference_result.get("success"):
+                    type_suggestions.update(inference_result)
                 
                 # 获取类型注解建议
-                annotation_result = await llm_client.suggest_type_annotations(
-                    request.code, ast_result["symbol_table"]
-                )
-                if annotation_result.get("success"):
+                annotation_result = llm_results["annotation"]
+                if isinstance(annotation_result, dict) and annotation_result.get("success"):
                     # 合并函数类型建议
                     if "function_annotations" in annotation_result:
                         type_suggestions["function_suggestions"] = {}
@@ -668,12 +801,13 @@ async def generate_type_annotations(request: CodeAnalysisRequest):
                 logger.error(f"LLM类型推断失败: {str(e)}")
         
         # 生成类型注解代码
-        annotation_result = analyzer.generate_type_annotated_code(request.code, type_suggestions)
+        annotation_result = _ast_analyzer.generate_type_annotated_code(request.code, type_suggestions)
         
         if annotation_result["success"]:
             # 保存到缓存
             try:
-                save_type_annotation_cache(
+                await asyncio.to_thread(
+                    save_type_annotation_cache,
                     code_hash=code_hash,
                     original_code=request.code,
                     annotated_code=annotation_result["annotated_code"],
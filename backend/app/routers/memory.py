@@ -1,10 +1,17 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+import asyncio
+import hashlib
 import logging
+from datetime import datetime, timezone
+
+import orjson
 
 from ..database import (
-    get_memory_patterns, get_type_inference_history,
+    get_memory_patterns_cached, get_type_inference_history_cached, get_memory_statistics_cached,
+    search_memory_patterns_db, get_export_bundle,
     get_analysis_record
 )
 
@@ -12,6 +19,10 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 列表接口的分页参数：默认每页条数与单页上限
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
 class MemoryPattern(BaseModel):
     id: int
     pattern_hash: str
@@ -33,136 +44,125 @@ class TypeInferenceRecord(BaseModel):
     validation_result: str
     created_at: str
 
+# 各接口最近一次序列化的结果：{接口名: (数据对象, JSON字节, ETag)}
+# 读缓存有效期内返回的是同一个数据对象，此时直接复用已序列化的结果；
+# 不同分页参数对应不同的数据对象，按数据对象判断即可，不会误用其他分页的结果
+_serialized_responses: Dict[str, Tuple[Any, bytes, str]] = {}
+
+def _etag_response(request: Request, name: str, data: Any, payload: Any = None) -> Response:
+    """序列化 payload（默认为 data）并附带 ETag，客户端缓存的版本未变化时返回 304"""
+    cached = _serialized_responses.get(name)
+    if cached and cached[0] is data:
+        body, etag = cached[1], cached[2]
+    else:
+        body = orjson.dumps(data if payload is None else payload)
+        etag = f'W/"{hashlib.md5(body, usedforsecurity=False).hexdigest()}"'
+        _serialized_responses[name] = (data, body, etag)
+    
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
 @router.get("/patterns", response_model=List[MemoryPattern])
-async def get_memory_patterns_api():
-    """获取所有记忆库模式"""
+async def get_memory_patterns_api(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    offset: int = Query(0, ge=0)
+):
+    """分页获取记忆库模式"""
     try:
-        patterns = get_memory_patterns()
-        return [MemoryPattern(**pattern) for pattern in patterns]
+        patterns = await asyncio.to_thread(get_memory_patterns_cached, limit, offset)
+        # 数据来自本地数据库且字段与 MemoryPattern 一致，直接序列化，不逐行做模型校验
+        return _etag_response(request, "patterns", patterns)
     except Exception as e:
         logger.error(f"获取记忆库模式失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取记忆库模式失败: {str(e)}")
 
 @router.get("/history", response_model=List[TypeInferenceRecord])
-async def get_type_inference_history_api():
-    """获取类型推导历史"""
+async def get_type_inference_history_api(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    offset: int = Query(0, ge=0)
+):
+    """分页获取类型推导历史"""
     try:
-        history = get_type_inference_history()
-        return [TypeInferenceRecord(**record) for record in history]
+        history = await asyncio.to_thread(get_type_inference_history_cached, limit, offset)
+        # 数据来自本地数据库且字段与 TypeInferenceRecord 一致，直接序列化，不逐行做模型校验
+        return _etag_response(request, "history", history)
     except Exception as e:
         logger.error(f"获取类型推导历史失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取类型推导历史失败: {str(e)}")
 
 @router.get("/statistics")
-async def get_memory_statistics():
+async def get_memory_statistics(request: Request):
     """获取记忆库统计信息"""
     try:
-        patterns = get_memory_patterns()
-        history = get_type_inference_history()
-        
-        # 计算统计信息
-        total_patterns = len(patterns)
-        total_inferences = len(history)
-        
-        # 最常用的模式
-        most_used_patterns = sorted(patterns, key=lambda x: x['usage_count'], reverse=True)[:5]
-        
-        # 置信度分布
-        confidence_distribution = {
-            "high": len([p for p in patterns if p['confidence_score'] >= 0.8]),
-            "medium": len([p for p in patterns if 0.5 <= p['confidence_score'] < 0.8]),
-            "low": len([p for p in patterns if p['confidence_score'] < 0.5])
-        }
-        
-        # 类型推导成功率
-        successful_inferences = len([h for h in history if h['validation_result'] == 'llm_inferred'])
-        success_rate = successful_inferences / total_inferences if total_inferences > 0 else 0
-        
-        return {
+        # 统计信息由SQLite聚合计算
+        statistics = await asyncio.to_thread(get_memory_statistics_cached)
+        return _etag_response(request, "statistics", statistics, {
             "success": True,
-            "statistics": {
-                "total_patterns": total_patterns,
-                "total_inferences": total_inferences,
-                "success_rate": success_rate,
-                "confidence_distribution": confidence_distribution,
-                "most_used_patterns": [
-                    {
-                        "pattern": p['code_pattern'],
-                        "usage_count": p['usage_count'],
-                        "confidence": p['confidence_score']
-                    }
-                    for p in most_used_patterns
-                ]
-            }
-        }
+            "statistics": statistics
+        })
         
     except Exception as e:
         logger.error(f"获取记忆库统计信息失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取记忆库统计信息失败: {str(e)}")
 
 @router.get("/search")
-async def search_memory_patterns(query: str = "", confidence_min: float = 0.0):
+async def search_memory_patterns(
+    query: str = "",
+    confidence_min: float = 0.0,
+    limit: int = Query(DEFAULT_PAGE_LIMIT, ge=1, le=MAX_PAGE_LIMIT),
+    offset: int = Query(0, ge=0)
+):
     """搜索记忆库模式"""
     try:
-        patterns = get_memory_patterns()
-        
-        # 过滤模式
-        filtered_patterns = []
-        for pattern in patterns:
-            # 按置信度过滤
-            if pattern['confidence_score'] < confidence_min:
-                continue
-            
-            # 按查询字符串过滤
-            if query and query.lower() not in pattern['code_pattern'].lower():
-                continue
-            
-            filtered_patterns.append(pattern)
+        # 置信度、查询字符串过滤和分页都在SQLite中完成
+        filtered_patterns, total_found = await asyncio.to_thread(
+            search_memory_patterns_db, query, confidence_min, limit, offset
+        )
         
         return {
             "success": True,
             "patterns": filtered_patterns,
-            "total_found": len(filtered_patterns)
+            "total_found": total_found
         }
         
     except Exception as e:
         logger.error(f"搜索记忆库模式失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"搜索记忆库模式失败: {str(e)}")
 
+# 分析缓存信息是固定内容，模块加载时序列化一次，请求时直接返回字节
+_CACHE_INFO_BYTES = orjson.dumps({
+    "success": True,
+    "cache_info": {
+        "description": "使用SQLite数据库存储分析结果",
+        "storage_type": "persistent",
+        "features": [
+            "代码哈希去重",
+            "AST数据缓存",
+            "符号表缓存",
+            "LLM推理结果缓存"
+        ]
+    }
+})
+
 @router.get("/analysis-cache")
 async def get_analysis_cache_info():
     """获取分析缓存信息"""
-    try:
-        # 这里可以添加缓存统计逻辑
-        # 由于我们使用简单的数据库存储，这里返回基本信息
-        
-        return {
-            "success": True,
-            "cache_info": {
-                "description": "使用SQLite数据库存储分析结果",
-                "storage_type": "persistent",
-                "features": [
-                    "代码哈希去重",
-                    "AST数据缓存", 
-                    "符号表缓存",
-                    "LLM推理结果缓存"
-                ]
-            }
-        }
-        
-    except Exception as e:
-        logger.error(f"获取分析缓存信息失败: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"获取分析缓存信息失败: {str(e)}")
+    return Response(content=_CACHE_INFO_BYTES, media_type="application/json")
 
-@router.get("/export")
+@router.get("/export", response_class=ORJSONResponse)
 async def export_memory_data():
     """导出记忆库数据"""
     try:
-        patterns = get_memory_patterns()
-        history = get_type_inference_history()
+        # 模式和历史在一个读事务中查询，只占用一次线程池调度和一个连接
+        patterns, history = await asyncio.to_thread(get_export_bundle)
         
         export_data = {
-            "export_time": "2024-01-01T00:00:00Z",  # 实际时间应该从datetime获取
+            "export_time": datetime.now(timezone.utc),
             "version": "1.0",
             "data": {
                 "memory_patterns": patterns,
@@ -174,10 +174,14 @@ async def export_memory_data():
             }
         }
         
-        return {
-            "success": True,
-            "export_data": export_data
-        }
+        # 导出数据量随记忆库增长，直接用 orjson 序列化（包括导出时间），跳过 jsonable_encoder 的逐层遍历
+        return Response(
+            content=orjson.dumps({
+                "success": True,
+                "export_data": export_data
+            }, option=orjson.OPT_UTC_Z | orjson.OPT_OMIT_MICROSECONDS),
+            media_type="application/json"
+        )
         
     except Exception as e:
         logger.error(f"导出记忆库数据失败: {str(e)}")
@@ -1,8 +1,12 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from app.routers import analysis, memory
-from app.database import init_database
+from app.database import init_database, db
+from app.core.llm_client import llm_client
 import logging
+import os
 
 # 配置日志
 logging.basicConfig(
@@ -10,10 +14,21 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时初始化数据库和LLM连接池，关闭时释放连接"""
+    init_database()
+    logging.info("Database initialized successfully")
+    await llm_client._ensure_client()
+    yield
+    await llm_client.close()
+    db.close()
+
 app = FastAPI(
     title="TypeSage API",
     description="大模型驱动的语义分析增强API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS配置
@@ -32,16 +47,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 响应压缩：AST、记忆库导出等接口返回的JSON较大且易于压缩
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # 包含路由
 app.include_router(analysis.router, prefix="/api/analysis", tags=["analysis"])
 app.include_router(memory.router, prefix="/api/memory", tags=["memory"])
 
-@app.on_event("startup")
-async def startup_event():
-    """应用启动时初始化数据库"""
-    init_database()
-    logging.info("Database initialized successfully")
-
 @app.get("/")
 async def root():
     return {"message": "TypeSage API is running!", "version": "1.0.0"}
@@ -52,4 +64,15 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # 多进程需要以导入字符串的形式传入应用；进程数通过 WEB_CONCURRENCY 环境变量设置，默认单进程。
+    # 读缓存失效和相同分析请求的合并都只在单个进程内生效：多进程时，其他进程的读缓存
+    # 可能在 READ_CACHE_TTL 内返回旧数据，并发的相同请求也可能落在不同进程上各自调用LLM
+    # 事件循环用 auto：uvloop 不支持 Windows，auto 会在可用时选择 uvloop，否则退回 asyncio
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        loop="auto",
+        http="httptools"
+    ) 
\ No newline at end of file
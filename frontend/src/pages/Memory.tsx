@@ -5,7 +5,7 @@ import { memoryAPI } from '../services/api'
 const Memory = () => {
   const [patterns, setPatterns] = useState([])
   const [history, setHistory] = useState([])
-  const [statistics, setStatistics] = useState(null)
+  const [statistics, setStatistics] = useState<any>(null)
   const [loading, setLoading] = useState(true)
   const [searchQuery, setSearchQuery] = useState('')
   const [confidenceFilter, setConfidenceFilter] = useState(0.0)
@@ -99,7 +99,7 @@ const Memory = () => {
           <h2 className="text-xl font-semibold text-gray-900 mb-4">记忆库概览</h2>
           <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
             <div className="text-center">
-              <div className="text-3xl font-bold text-blue-600">{patterns.length}</div>
+              <div className="text-3xl font-bold text-blue-600">{statistics?.total_patterns ?? patterns.length}</div>
               <div className="text-sm text-gray-600">记忆模式</div>
             </div>
             <div className="text-center">
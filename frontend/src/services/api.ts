@@ -114,14 +114,14 @@ export const analysisAPI = {
 // 记忆库相关API
 export const memoryAPI = {
   // 获取记忆库模式
-  getPatterns: async (params?: { page?: number; page_size?: number }) => {
+  getPatterns: async (params?: { limit?: number; offset?: number }) => {
     const response = await api.get('/api/memory/patterns', { params })
     return response.data
   },
 
   // 获取类型推导历史
-  getHistory: async () => {
-    const response = await api.get('/api/memory/history')
+  getHistory: async (params?: { limit?: number; offset?: number }) => {
+    const response = await api.get('/api/memory/history', { params })
     return response.data
   },
 
@@ -0,0 +1,209 @@
+import sys
+import json
+import asyncio
+import gc
+import textwrap
+sys.path.append('.')
+
+from backend.app.core.analyzer import generate_code_hash, normalize_code
+from backend.app.core.llm_client import llm_client
+from backend.app.database import init_database, clear_all_caches, save_analysis_record, get_analysis_record
+from backend.app.routers import analysis as analysis_router
+from backend.app.routers.analysis import (
+    CodeAnalysisRequest, CodeAnalysisResponse, _analyze_code, _json_response, _run_code_analysis,
+    analyze_code, clear_specific_cache
+)
+
+def test_large_int_response():
+    print("=== 分析响应序列化测试 ===")
+
+    init_database()
+
+    # 超出64位的整数常量：orjson 无法序列化，需要退回标准库 json
+    test_code = "MASK = 0xFFFFFFFFFFFFFFFFFFFF\n"
+    code_hash = generate_code_hash(normalize_code(test_code))
+    ast_result = _analyze_code(test_code)
+
+    response = _json_response(CodeAnalysisResponse.model_construct(
+        success=True,
+        code_hash=code_hash,
+        ast_data=ast_result["ast"],
+        symbol_table=ast_result["symbol_table"],
+        cached=False
+    ))
+    body = json.loads(response.body)
+    if body["success"] and str(0xFFFFFFFFFFFFFFFFFFFF) in response.body.decode('utf-8'):
+        print("✅ 新分析结果中的超大整数序列化成功")
+    else:
+        print("❌ 新分析结果中的超大整数序列化失败")
+
+    # 缓存命中路径：记录由标准库 json 保存，读取后同样需要能返回
+    save_analysis_record(code_hash, test_code, ast_result["ast"], ast_result["symbol_table"], {}, {})
+    cached_result = get_analysis_record(code_hash)
+    response = _json_response(CodeAnalysisResponse.model_construct(
+        success=True,
+        code_hash=code_hash,
+        ast_data=cached_result["ast_data"],
+        symbol_table=cached_result["symbol_table"],
+        cached=True
+    ))
+    if json.loads(response.body)["cached"]:
+        print("✅ 缓存结果中的超大整数序列化成功")
+    else:
+        print("❌ 缓存结果中的超大整数序列化失败")
+
+class FakeLLM:
+    """替代 llm_client 的三个分析方法：按代码实际内容返回结果，并记录类型推断的调用次数"""
+
+    def __init__(self, inferred_type="int"):
+        self.inference_calls = 0
+        self.inferred_type = inferred_type
+
+    async def infer_variable_types(self, code, undeclared_vars):
+        self.inference_calls += 1
+        return {
+            "success": True,
+            "inferences": {var["name"]: self.inferred_type for var in undeclared_vars},
+            "explanations": {},
+            "confidence": {var["name"]: 0.9 for var in undeclared_vars}
+        }
+
+    async def suggest_type_annotations(self, code, symbol_table):
+        return {
+            "success": True,
+            "function_annotations": {name: {"params": {}, "return": "str"} for name in symbol_table.get("functions", {})},
+            "variable_annotations": {},
+            "confidence": 0.9
+        }
+
+    async def analyze_code_quality(self, code):
+        return {"success": True, "issues": [], "suggestions": [], "score": 90}
+
+def use_fake_llm(fake):
+    """用 fake 替换 llm_client 的分析方法，返回原方法供恢复"""
+    originals = {name: getattr(llm_client, name) for name in ("infer_variable_types", "suggest_type_annotations", "analyze_code_quality")}
+    for name in originals:
+        setattr(llm_client, name, getattr(fake, name))
+    return originals
+
+def restore_llm(originals):
+    for name, method in originals.items():
+        setattr(llm_client, name, method)
+
+async def analyze(code, save_to_memory=False):
+    request = CodeAnalysisRequest(code=code, use_llm=True, save_to_memory=save_to_memory, use_cache=True)
+    return await _run_code_analysis(request, generate_code_hash(normalize_code(code)))
+
+def test_semantic_cache_renamed_function():
+    print("\n=== 语义缓存测试：近似代码中的函数重命名 ===")
+
+    init_database()
+    clear_all_caches()
+
+    fake = FakeLLM()
+    originals = use_fake_llm(fake)
+
+    try:
+        with open(textwrap.__file__, encoding="utf-8") as f:
+            source = f.read() + "\nresult = total_count + 1\n"
+        renamed = source.replace("shorten", "abbreviate")
+
+        asyncio.run(analyze(source))
+        response = asyncio.run(analyze(renamed))
+    finally:
+        restore_llm(originals)
+
+    if response.semantic and fake.inference_calls == 1:
+        print("✅ 近似代码复用了变量类型推断结果")
+    else:
+        print("❌ 近似代码未复用变量类型推断结果")
+
+    function_annotations = response.type_annotations.get("function_annotations", {})
+    if "abbreviate" in function_annotations and "shorten" not in function_annotations:
+        print("✅ 函数注解针对当前代码生成，包含重命名后的函数")
+    else:
+        print("❌ 函数注解来自近似代码，缺少重命名后的函数")
+
+    record = get_analysis_record(response.code_hash)
+    if record and record["llm_suggestions"]["type_inference"].get("semantic"):
+        print("✅ 保存的记录标记了语义复用的类型推断")
+    else:
+        print("❌ 保存的记录未标记语义复用的类型推断")
+
+def test_clear_code_cache_then_reanalyze():
+    print("\n=== 清除特定代码缓存后重新分析 ===")
+
+    init_database()
+    clear_all_caches()
+
+    code = "result = item_count * 2\n"
+    code_hash = generate_code_hash(normalize_code(code))
+
+    originals = use_fake_llm(FakeLLM("int"))
+    try:
+        asyncio.run(analyze(code, save_to_memory=True))
+        asyncio.run(clear_specific_cache(code_hash))
+
+        # 清除后重新分析必须重新调用LLM，不能再使用记忆库中的旧推断
+        fake = FakeLLM("float")
+        use_fake_llm(fake)
+        response = asyncio.run(analyze(code, save_to_memory=True))
+    finally:
+        restore_llm(originals)
+
+    inferences = response.llm_suggestions["type_inference"]["inferences"]
+    if fake.inference_calls == 1 and inferences == {"item_count": "float"}:
+        print("✅ 清除缓存后重新调用LLM推断类型")
+    else:
+        print(f"❌ 清除缓存后仍使用了旧的推断结果: {inferences}")
+
+def test_inflight_analysis_failure():
+    print("\n=== 并发相同请求的失败传递 ===")
+
+    calls = 0
+
+    async def failing_analysis(request, code_hash):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        raise RuntimeError("分析服务异常")
+
+    async def run():
+        loop_errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: loop_errors.append(context))
+        request = CodeAnalysisRequest(code="x = 1\n", use_cache=False)
+
+        # 三个并发的相同请求共享一个分析任务，都应收到同一个错误
+        results = await asyncio.gather(*(analyze_code(request) for _ in range(3)), return_exceptions=True)
+        details = {getattr(result, "detail", None) for result in results}
+
+        # 唯一的等待者断开后任务才失败：异常应已被取出，不产生未获取异常的警告
+        waiter = asyncio.create_task(analyze_code(request))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0.1)
+        gc.collect()
+        return details, loop_errors
+
+    original = analysis_router._run_code_analysis
+    analysis_router._run_code_analysis = failing_analysis
+    try:
+        details, loop_errors = asyncio.run(run())
+    finally:
+        analysis_router._run_code_analysis = original
+
+    if calls == 2 and details == {"代码分析失败: 分析服务异常"}:
+        print("✅ 并发的相同请求共享一次分析并收到同一个错误")
+    else:
+        print(f"❌ 并发请求的错误传递不正确: 分析 {calls} 次, 错误 {details}")
+
+    if not analysis_router._inflight_analyses and not loop_errors:
+        print("✅ 失败的分析任务已移出合并表且异常已被取出")
+    else:
+        print(f"❌ 失败的分析任务未正确清理: {analysis_router._inflight_analyses}, {loop_errors}")
+
+if __name__ == "__main__":
+    test_large_int_response()
+    test_semantic_cache_renamed_function()
+    test_clear_code_cache_then_reanalyze()
+    test_inflight_analysis_failure()
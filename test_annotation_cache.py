@@ -2,8 +2,10 @@ import sys
 import time
 sys.path.append('.')
 
-from backend.app.core.analyzer import generate_code_hash
-from backend.app.database import init_database, save_type_annotation_cache, get_type_annotation_cache
+from backend.app.core.analyzer import generate_code_hash, normalize_code
+from backend.app.database import (
+    init_database, save_type_annotation_cache, save_type_annotation_caches, get_type_annotation_cache
+)
 
 def test_annotation_cache():
     print("=== 类型注解缓存功能测试 ===")
@@ -110,6 +112,44 @@ name: str = "TypeSage"
         print("✅ use_llm=False 的缓存保存和读取成功")
     else:
         print("❌ use_llm=False 的缓存读取失败")
+    
+    # 测试批量保存缓存
+    print("\n=== 测试批量保存缓存 ===")
+    batch_codes = [f"value_{i} = {i}\n" for i in range(50)]
+    save_type_annotation_caches([
+        {
+            "code_hash": generate_code_hash(code),
+            "original_code": code,
+            "annotated_code": code.replace(" =", ": int =", 1),
+            "type_info": {"variables": {f"value_{i}": {"type": "int", "line": 1}}},
+            "annotations_count": 1,
+            "llm_suggestions_used": False,
+            "use_llm": False
+        }
+        for i, code in enumerate(batch_codes)
+    ])
+    batch_results = [get_type_annotation_cache(generate_code_hash(code), use_llm=False) for code in batch_codes]
+    if all(result and result["annotated_code"] == f"value_{i}: int = {i}\n" for i, result in enumerate(batch_results)):
+        print(f"✅ 批量保存 {len(batch_codes)} 条缓存成功")
+    else:
+        print("❌ 批量保存缓存失败")
+    
+    # 测试缓存键的规范化
+    print("\n=== 测试缓存键规范化 ===")
+    if generate_code_hash(normalize_code("x = 1\r\ny = 2\r\n")) == generate_code_hash(normalize_code("x = 1\ny = 2\n")):
+        print("✅ 仅换行符不同的代码共享缓存键")
+    else:
+        print("❌ 仅换行符不同的代码未共享缓存键")
+    
+    # 字符串字面量中的行尾空白、行尾的续行反斜杠都会改变代码含义，不能共享缓存键
+    distinct_pairs = [
+        ('S = """a   \nb"""\n', 'S = """a\nb"""\n'),
+        ("x = 1 + \\ \n2\n", "x = 1 + \\\n2\n"),
+    ]
+    if all(generate_code_hash(normalize_code(a)) != generate_code_hash(normalize_code(b)) for a, b in distinct_pairs):
+        print("✅ 行尾空白影响语义的代码使用不同的缓存键")
+    else:
+        print("❌ 行尾空白影响语义的代码共享了缓存键")
 
 if __name__ == "__main__":
     test_annotation_cache() 
\ No newline at end of file
@@ -14,6 +14,9 @@ sys.path.append('.')
 
 from backend.app.core.analyzer import ASTAnalyzer
 
+# 与路由一致，所有测试共用同一个分析器实例
+ANALYZER = ASTAnalyzer()
+
 def test_class_instantiation_inference():
     print("=== 类实例化类型推导测试 ===")
     
@@ -30,7 +33,7 @@ g = Greeter("Alice")
 g.greet()
 '''
     
-    analyzer = ASTAnalyzer()
+    analyzer = ANALYZER
     result = analyzer.analyze(test_code)
     
     if result["success"]:
@@ -74,7 +77,7 @@ calc = Calculator()
 result = calc.add(5, 3)
 '''
     
-    analyzer = ASTAnalyzer()
+    analyzer = ANALYZER
     annotation_result = analyzer.generate_type_annotated_code(test_code)
     
     if annotation_result["success"]:
@@ -119,7 +122,7 @@ car = Car("Toyota", "Camry")
 another_person = Person("Bob", 25)
 '''
     
-    analyzer = ASTAnalyzer()
+    analyzer = ANALYZER
     result = analyzer.analyze(test_code)
     
     if result["success"]:
@@ -158,7 +161,7 @@ builtin_dict = dict()
 builtin_set = set()
 '''
     
-    analyzer = ASTAnalyzer()
+    analyzer = ANALYZER
     result = analyzer.analyze(test_code)
     
     if result["success"]:
@@ -0,0 +1,81 @@
+import sys
+sys.path.append('.')
+
+from backend.app.database import (
+    init_database, clear_all_caches, clear_code_caches, search_memory_patterns_db,
+    save_memory_pattern, save_memory_patterns_many,
+    save_type_inference_history, save_type_inference_history_many,
+    get_memory_patterns_cached, get_type_inference_history_cached, get_memory_statistics_cached
+)
+
+def test_memory_search():
+    print("=== 记忆库搜索测试 ===")
+
+    init_database()
+    clear_all_caches()
+
+    for i, pattern in enumerate(["Ärger = melden()", "value_1 = 1", "straße = 'x'"]):
+        save_memory_pattern(f"search_{i}", pattern, {"x": "str"}, 0.9)
+
+    # 短查询走 casefold 匹配，非ASCII字母同样忽略大小写
+    patterns, total_found = search_memory_patterns_db("är")
+    if total_found == 1 and patterns[0]["code_pattern"] == "Ärger = melden()":
+        print("✅ 非ASCII短查询忽略大小写")
+    else:
+        print(f"❌ 非ASCII短查询未找到匹配: {patterns}")
+
+    # 长查询走 trigram 全文索引
+    patterns, total_found = search_memory_patterns_db("ÄRGER")
+    if total_found == 1 and patterns[0]["code_pattern"] == "Ärger = melden()":
+        print("✅ 非ASCII长查询忽略大小写")
+    else:
+        print(f"❌ 非ASCII长查询未找到匹配: {patterns}")
+
+    # LIKE 通配符按字面匹配
+    patterns, total_found = search_memory_patterns_db("_")
+    if total_found == 1 and patterns[0]["code_pattern"] == "value_1 = 1":
+        print("✅ 通配符按字面匹配")
+    else:
+        print(f"❌ 通配符匹配错误: {patterns}")
+
+def _cached_counts():
+    """通过带缓存的读取接口获取记忆模式数、推导历史数和统计信息中的对应数量"""
+    statistics = get_memory_statistics_cached()
+    return (
+        len(get_memory_patterns_cached()),
+        len(get_type_inference_history_cached()),
+        statistics["total_patterns"],
+        statistics["total_inferences"]
+    )
+
+def test_read_cache_invalidation():
+    print("\n=== 读缓存失效测试 ===")
+
+    init_database()
+    clear_all_caches()
+
+    history_row = ("x", "x = y", "unknown", "int", "int", 0.9, "llm_inferred")
+    # (写入操作说明, 写入操作, 写入后期望的 (模式数, 历史数))
+    write_paths = [
+        ("save_memory_pattern", lambda: save_memory_pattern("cache_a", "a = 1", {"a": "int"}, 0.9), (1, 0)),
+        ("save_memory_patterns_many", lambda: save_memory_patterns_many([
+            ("cache_b", "b = 2", {"b": "int"}, 0.9), ("cache_c", "c = 3", {"c": "int"}, 0.9)
+        ]), (3, 0)),
+        ("save_type_inference_history", lambda: save_type_inference_history(*history_row), (3, 1)),
+        ("save_type_inference_history_many", lambda: save_type_inference_history_many([history_row] * 2), (3, 3)),
+        ("clear_code_caches", lambda: clear_code_caches("no_such_code_hash", "cache_a"), (2, 3)),
+        ("clear_all_caches", clear_all_caches, (0, 0)),
+    ]
+
+    for name, write, (patterns_expected, history_expected) in write_paths:
+        _cached_counts()  # 写入前先读取一次，使结果进入读缓存
+        write()
+        counts = _cached_counts()
+        if counts == (patterns_expected, history_expected, patterns_expected, history_expected):
+            print(f"✅ {name} 写入后读取到最新数据")
+        else:
+            print(f"❌ {name} 写入后读取到旧数据: {counts}")
+
+if __name__ == "__main__":
+    test_memory_search()
+    test_read_cache_invalidation()